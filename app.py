@@ -11,8 +11,8 @@ from datetime import datetime
 import pandas as pd
 import streamlit as st
 
-from src.extractors import extract_from_file, parse_bid_response_excel, SUPPORTED_EXTENSIONS
-from src.pipeline import build_prebid_report, load_risk_factors
+from src.extractors import extract_from_file, SUPPORTED_EXTENSIONS
+from src.pipeline import DETAIL_MODELS, build_prebid_report, load_knowledge_context, load_risk_factors
 from src.report_docx import build_docx
 
 # ─── Page config (must be first Streamlit call) ───────────────────
@@ -84,46 +84,6 @@ def _migrate_risk_register(rf: dict) -> tuple[dict, bool]:
     return rf, migrated
 
 
-def _load_knowledge_context(max_chars_per_file: int = 20_000, max_total: int = 80_000) -> str:
-    """Load past bid response documents from the knowledge base.
-
-    Excel files (.xlsx/.xls) are parsed with the dedicated compliance-matrix
-    parser so that Y/N/partially answers are correctly categorised and the AI
-    receives a structured summary rather than raw tab-separated cell dumps.
-    Other formats are read as plain text.
-    """
-    parts = []
-    total = 0
-    for folder, label in [
-        ("responses", "PAST BID RESPONSE — Inpeco"),
-        # backward-compat with old won/lost folders
-        ("won",  "PAST BID RESPONSE (won) — Inpeco"),
-        ("lost", "PAST BID RESPONSE (lost) — Inpeco"),
-    ]:
-        folder_path = f"assets/knowledge/{folder}"
-        if not os.path.exists(folder_path):
-            continue
-        for fn in sorted(os.listdir(folder_path)):
-            if total >= max_total:
-                break
-            fp = os.path.join(folder_path, fn)
-            try:
-                with open(fp, "rb") as f:
-                    file_bytes = f.read()
-                ext = fn.rsplit(".", 1)[-1].lower() if "." in fn else ""
-                if ext in ("xlsx", "xls"):
-                    text = parse_bid_response_excel(file_bytes, fn)
-                else:
-                    pages = extract_from_file(file_bytes, fn)
-                    text = "\n".join(pages)
-                text = text[:max_chars_per_file]
-                parts.append(f"=== {label}: {fn} ===\n{text}")
-                total += len(text)
-            except Exception:
-                pass
-    return "\n\n".join(parts)
-
-
 def _ai_format_risk(concept: str, entry_type: str, rf: dict, level: str = "Medium") -> dict:
     """Convert a plain-language risk description into a structured JSON entry using GPT-4o."""
     from openai import OpenAI
@@ -1184,6 +1144,12 @@ def view_analyze():
                 unsafe_allow_html=True,
             )
 
+        refresh_cache = st.checkbox(
+            "Re-run analysis (ignore stored report)",
+            value=False,
+            help="Reports are cached per document and settings; tick to call the API again.",
+        )
+
         if st.button("🔍 Run Analysis", disabled=not can_run, type="primary"):
             all_pages: list[str] = []
             skipped: list[str] = []
@@ -1209,7 +1175,7 @@ def view_analyze():
                 st.error("No readable content found in the uploaded files. Please check the file formats.")
                 st.stop()
 
-            knowledge_ctx = _load_knowledge_context()
+            knowledge_ctx = load_knowledge_context()
             n_kb = len([
                 fn
                 for folder in (
@@ -1221,8 +1187,9 @@ def view_analyze():
                 for fn in os.listdir(folder)
             ])
             runs = st.session_state.get("consensus_runs", 1)
+            _model_label = DETAIL_MODELS.get(detail, "gpt-4o").replace("gpt", "GPT")
             spinner_msg = (
-                f"Analysing {len(uploaded_files)} file(s) with GPT-4o [{detail}]"
+                f"Analysing {len(uploaded_files)} file(s) with {_model_label} [{detail}]"
                 + (f" · {n_kb} KB doc(s) in KB" if n_kb else "")
                 + (f" · {runs}× consensus" if runs > 1 else "")
                 + "…"
@@ -1238,6 +1205,8 @@ def view_analyze():
                         _kw["knowledge_context"] = knowledge_ctx
                     if "runs" in _sig.parameters:
                         _kw["runs"] = runs
+                    if "refresh_cache" in _sig.parameters:
+                        _kw["refresh_cache"] = refresh_cache
                     if "knowledge_context" not in _sig.parameters and knowledge_ctx:
                         # Legacy pipeline without knowledge_context param — prepend as page
                         all_pages = [f"=== COMPANY KNOWLEDGE BASE ===\n{knowledge_ctx}"] + all_pages
@@ -2146,10 +2115,24 @@ def _render_report(report: dict):
         if meta:
             with st.expander("API usage"):
                 st.caption(f"Model: {meta.get('model','gpt-4o')}")
+                if meta.get("cache_hit"):
+                    st.caption("Served from report cache — no API call made")
                 if meta.get("runs", 1) > 1:
                     st.caption(f"Runs: {meta['runs']}× consensus merge")
+                if meta.get("runs_requested", 0) > meta.get("runs", 1):
+                    st.caption(
+                        f"⚠️ Only {meta.get('runs', 1)} of {meta['runs_requested']} runs "
+                        "completed (others hit the output limit); not cached"
+                    )
                 st.caption(f"Tokens: {meta.get('total_tokens',0):,}")
-                st.caption(f"Cost: ${meta.get('estimated_cost_usd',0):.4f}")
+                if meta.get("cached_tokens"):
+                    st.caption(f"Cached prompt tokens: {meta['cached_tokens']:,}")
+                if meta.get("cache_hit"):
+                    st.caption(
+                        f"Cost: $0.0000 (original run: ${meta.get('cached_cost_usd',0):.4f})"
+                    )
+                else:
+                    st.caption(f"Cost: ${meta.get('estimated_cost_usd',0):.4f}")
                 st.caption(f"Sections: {meta.get('pages_analyzed',0)}")
                 if meta.get("truncated"):
                     st.caption(f"⚠️ Truncated at {meta.get('chars_analyzed',0):,} chars")
@@ -5,8 +5,17 @@ No domain-specific logic; all analytical logic is delegated to the AI layer.
 from __future__ import annotations
 
 import io
+import multiprocessing
+import os
 import re
-from typing import List, Tuple
+import tempfile
+import zipfile
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from itertools import chain, islice
+from typing import Iterable, Iterator, List, Tuple, Union
 
 
 # ─── Text chunking helpers ────────────────────────────────────────
@@ -39,12 +48,78 @@ def chunk_pages(pages: List[str], max_chars: int = 120_000) -> List[str]:
     return chunks
 
 
-def extract_raw_text(pages: List[str]) -> str:
-    """Return the full document text with page markers for single-pass AI analysis."""
+# Header/footer zone: this many non-blank lines at the top and bottom of a page
+_EDGE_LINES = 3
+
+
+def strip_repeated_lines(pages: List[str], max_line_len: int = 120) -> List[str]:
+    """
+    Drop header/footer boilerplate from real PDF pages: short lines in the first
+    or last few lines of a page that recur there on more than half of the pages
+    (and on 3 or more) are kept only on the first page showing them. Body lines,
+    repeats within one page and pages too short to have a body are never touched.
+    """
+    # A majority, so that table cells running across a block of pages are kept
+    threshold = max(3, len(pages) // 2 + 1)
+    if len(pages) < threshold:
+        return pages
+
+    page_lines = [p.splitlines() for p in pages]
+    page_edges: List[List[int]] = []
+    freq: Counter = Counter()
+    for lines in page_lines:
+        filled = [i for i, l in enumerate(lines) if l.strip()]
+        if len(filled) <= 2 * _EDGE_LINES:
+            page_edges.append([])
+            continue
+        edges = filled[:_EDGE_LINES] + filled[-_EDGE_LINES:]
+        page_edges.append(edges)
+        freq.update({lines[i].strip() for i in edges if len(lines[i].strip()) < max_line_len})
+    boiler = {l for l, c in freq.items() if c >= threshold}
+    if not boiler:
+        return pages
+
+    seen: set = set()
+    cleaned: List[str] = []
+    for page, lines, edges in zip(pages, page_lines, page_edges):
+        found = {lines[i].strip() for i in edges} & boiler
+        drop = {i for i in edges if lines[i].strip() in found & seen}
+        seen |= found
+        cleaned.append(
+            "\n".join(l for i, l in enumerate(lines) if i not in drop) if drop else page
+        )
+    return cleaned
+
+
+def extract_raw_text(pages: Iterable[str], max_chars: int | None = None) -> str:
+    """Return the full document text with page markers for single-pass AI analysis.
+
+    With max_chars, stops reading pages once that many characters are collected
+    and returns at most max_chars characters.
+    """
     parts = []
+    total = 0
     for i, page_text in enumerate(pages, start=1):
-        parts.append(f"\n\n--- PAGE {i} ---\n{page_text.strip()}")
-    return "".join(parts)
+        part = f"\n\n--- PAGE {i} ---\n{page_text.strip()}"
+        parts.append(part)
+        total += len(part)
+        if max_chars is not None and total >= max_chars:
+            break
+    text = "".join(parts)
+    return text if max_chars is None else text[:max_chars]
+
+
+# Date formats looked for on the first page (numeric, EN / IT / DE month names)
+_DATE_PAT = re.compile(
+    r"\b(\d{1,2}[./]\d{1,2}[./]20\d{2})\b"
+    r"|"
+    r"\b((?:January|February|March|April|May|June|July|August|September"
+    r"|October|November|December|gennaio|febbraio|marzo|aprile|maggio"
+    r"|giugno|luglio|agosto|settembre|ottobre|novembre|dicembre"
+    r"|Januar|Februar|März|April|Mai|Juni|Juli|August|September"
+    r"|Oktober|November|Dezember)\s+20\d{2})\b",
+    re.IGNORECASE,
+)
 
 
 def guess_title_and_date(pages: List[str]) -> Tuple[str, str]:
@@ -62,19 +137,8 @@ def guess_title_and_date(pages: List[str]) -> Tuple[str, str]:
     if lines:
         title = lines[0][:150]
 
-    date_pat = re.compile(
-        r"\b(\d{1,2}[./]\d{1,2}[./]20\d{2})\b"
-        r"|"
-        r"\b((?:January|February|March|April|May|June|July|August|September"
-        r"|October|November|December|gennaio|febbraio|marzo|aprile|maggio"
-        r"|giugno|luglio|agosto|settembre|ottobre|novembre|dicembre"
-        r"|Januar|Februar|März|April|Mai|Juni|Juli|August|September"
-        r"|Oktober|November|Dezember)\s+20\d{2})\b",
-        re.IGNORECASE,
-    )
-
     for line in lines[:15]:
-        m = date_pat.search(line)
+        m = _DATE_PAT.search(line)
         if m:
             date = m.group(0)
             break
@@ -84,13 +148,99 @@ def guess_title_and_date(pages: List[str]) -> Tuple[str, str]:
 
 # ─── Per-format extraction ────────────────────────────────────────
 
+PdfSource = Union[bytes, str, os.PathLike]
+
 _CHUNK_SIZE = 3_000  # chars per synthetic "page" for non-PDF formats
 
 
-def _extract_pdf(file_bytes: bytes) -> List[str]:
+def _open_pdf(source: PdfSource):
+    """Open a PDF from bytes or from a path; a path lets MuPDF read the file lazily."""
+    import fitz  # PyMuPDF
+    if isinstance(source, (str, os.PathLike)):
+        return fitz.open(source)
+    return fitz.open(stream=source, filetype="pdf")
+
+
+def iter_pdf_pages(source: PdfSource) -> Iterator[str]:
+    """Yield the text of each PDF page in turn; the document is closed when exhausted."""
     import fitz  # PyMuPDF
-    doc = fitz.open(stream=file_bytes, filetype="pdf")
-    return [doc[i].get_text("text") for i in range(len(doc))]
+    with _open_pdf(source) as doc:
+        for i in range(doc.page_count):
+            yield doc[i].get_text("text")
+    # MuPDF keeps fonts and images of closed documents in a process-wide store;
+    # empty it so a long-running app does not grow with every PDF it reads.
+    fitz.TOOLS.store_shrink(100)
+
+
+# Below this page count, starting worker processes costs more than it saves
+_PARALLEL_PDF_PAGES = 200
+_MAX_PDF_WORKERS = 8
+
+
+def _pdf_page_range(job: Tuple[PdfSource, int, int]) -> List[str]:
+    """Worker: extract pages [lo, hi) from a private copy of the document."""
+    source, lo, hi = job
+    with _open_pdf(source) as doc:
+        return [doc[i].get_text("text") for i in range(lo, hi)]
+
+
+def _read_pdf_parallel(source: PdfSource, n_pages: int, workers: int) -> List[str]:
+    """Extract page ranges in spawned worker processes, each opening its own copy."""
+    tmp_path = None
+    if not isinstance(source, (str, os.PathLike)):
+        # Workers get a path, not a pickled copy of the bytes each
+        with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as fh:
+            fh.write(source)
+            tmp_path = fh.name
+        source = tmp_path
+
+    step = -(-n_pages // workers)   # ceil division
+    jobs = [(source, lo, min(lo + step, n_pages)) for lo in range(0, n_pages, step)]
+    try:
+        # spawn, not fork: forking the threaded Streamlit server can deadlock a child
+        with ProcessPoolExecutor(
+            max_workers=len(jobs), mp_context=multiprocessing.get_context("spawn"),
+        ) as pool:
+            return [text for part in pool.map(_pdf_page_range, jobs) for text in part]
+    finally:
+        if tmp_path:
+            os.unlink(tmp_path)
+
+
+def read_pdf_pages(source: PdfSource) -> List[str]:
+    """
+    Extract text from each page of a PDF, given as bytes or as a file path.
+
+    Large documents are split into page ranges extracted in parallel.
+    PyMuPDF is not thread-safe, so this uses worker processes, each opening
+    its own copy of the document from a file path (bytes are spilled to a
+    temporary file once). Smaller documents are read from the already-open
+    document.
+    """
+    import fitz  # PyMuPDF
+
+    workers = min(os.cpu_count() or 1, _MAX_PDF_WORKERS)
+    with _open_pdf(source) as doc:
+        n_pages = doc.page_count
+        if n_pages < _PARALLEL_PDF_PAGES or workers < 2:
+            pages = [doc[i].get_text("text") for i in range(n_pages)]
+        else:
+            pages = None
+    if pages is not None:
+        fitz.TOOLS.store_shrink(100)
+        return pages
+
+    try:
+        return _read_pdf_parallel(source, n_pages, workers)
+    except (OSError, BrokenProcessPool):
+        # Sandboxed hosts may not allow spawning processes
+        return list(iter_pdf_pages(source))
+
+
+def _extract_pdf(source: PdfSource) -> List[str]:
+    """PDF pages for analysis. Only real pages carry running headers and footers,
+    so boilerplate is stripped here rather than from every format's chunks."""
+    return strip_repeated_lines(read_pdf_pages(source))
 
 
 def _extract_docx(file_bytes: bytes) -> List[str]:
@@ -155,16 +305,20 @@ _NOTE_KW   = ("note", "comment", "commento", "osservazione",
                "giustif", "justif", "motiv")
 
 # Values normalised to compliance categories
-_VAL_NO      = {"n", "no", "0", "false", "non conforme", "not fulfilled",
-                "not compliant", "not met", "non soddisfatto", "x", "no/n"}
-_VAL_PARTIAL = {"partial", "parziale", "partially", "p", "part",
-                "in parte", "partially compliant", "parzialmente",
-                "partially fulfilled"}
-_VAL_YES     = {"y", "yes", "si", "sì", "1", "true", "conforme",
-                "fulfilled", "compliant", "met", "soddisfatto", "ok"}
-_VAL_MAND    = {"m", "mandatory", "obbligatorio", "required", "yes",
-                "y", "si", "sì", "1", "true", "critical", "critici",
-                "obblig"}
+_VAL_NO      = frozenset({"n", "no", "0", "false", "non conforme", "not fulfilled",
+                          "not compliant", "not met", "non soddisfatto", "x", "no/n"})
+_VAL_PARTIAL = frozenset({"partial", "parziale", "partially", "p", "part",
+                          "in parte", "partially compliant", "parzialmente",
+                          "partially fulfilled"})
+_VAL_YES     = frozenset({"y", "yes", "si", "sì", "1", "true", "conforme",
+                          "fulfilled", "compliant", "met", "soddisfatto", "ok"})
+_VAL_MAND    = frozenset({"m", "mandatory", "obbligatorio", "required", "yes",
+                          "y", "si", "sì", "1", "true", "critical", "critici",
+                          "obblig"})
+_PARTIAL_SUBSTR = ("partial", "parzial", "in parte")
+
+_MAX_YES_EXAMPLES = 20   # compliant mandatory rows quoted per sheet
+_HEAD_ROWS = 60          # rows kept in memory: header search + raw-dump fallback
 
 
 def _col_index(headers: List[str], keywords: tuple) -> int:
@@ -181,6 +335,38 @@ def _norm(val) -> str:
     return str(val).strip().lower() if val is not None else ""
 
 
+# Bucket codes returned by _classify
+_SKIP, _MAND_NO, _MAND_PARTIAL, _MAND_YES, _OPT_NO, _OPT_PARTIAL = range(6)
+_N_BUCKETS = 6
+
+
+@lru_cache(maxsize=4096)
+def _classify(compl_raw: str, mand_raw: str) -> int:
+    """Map normalised compliance / mandatory cell values to a bucket code.
+    Cached because a compliance matrix only uses a handful of distinct values."""
+    is_mand = any(kw in mand_raw for kw in _VAL_MAND) if mand_raw else True
+
+    # Exact matches are plain set lookups; only "partial" also needs a substring scan
+    if compl_raw in _VAL_NO:
+        return _MAND_NO if is_mand else _OPT_NO
+    if compl_raw in _VAL_PARTIAL or any(v in compl_raw for v in _PARTIAL_SUBSTR):
+        return _MAND_PARTIAL if is_mand else _OPT_PARTIAL
+    if is_mand and compl_raw in _VAL_YES:
+        return _MAND_YES
+    return _SKIP
+
+
+def _row_line(row, req_col: int, compl_col: int, note_col: int) -> str:
+    """Format one compliance-matrix row as a bullet line for the prompt."""
+    req_text  = _norm(row[req_col])   if req_col  < len(row) else ""
+    note_text = _norm(row[note_col])  if note_col != -1 and note_col < len(row) else ""
+    compl_raw = str(row[compl_col]).strip() if compl_col < len(row) and row[compl_col] is not None else ""
+    line = f"• [{compl_raw}] {req_text}"
+    if note_text and note_text not in ("none", "nan", ""):
+        line += f"  → Note: {note_text}"
+    return line
+
+
 def parse_bid_response_excel(file_bytes: bytes, filename: str) -> str:
     """
     Parse a past-bid-response Excel compliance matrix and return a structured
@@ -199,24 +385,28 @@ def parse_bid_response_excel(file_bytes: bytes, filename: str) -> str:
     except Exception as exc:
         return f"(Could not parse {filename}: {exc})"
 
-    all_sections: List[str] = []
+    out = io.StringIO()   # all sheets, separated by blank lines
 
     for sheet in wb.worksheets:
-        raw_rows = list(sheet.iter_rows(values_only=True))
-        if len(raw_rows) < 2:
+        # Stream rows: only the first _HEAD_ROWS are ever needed as a list
+        # (header search + raw-dump fallback); the rest are bucketed on the fly.
+        rows_iter = sheet.iter_rows(values_only=True)
+        head_rows = list(islice(rows_iter, _HEAD_ROWS))
+        if len(head_rows) < 2:
             continue
 
         # Find first non-empty row as header (search up to row 5)
         header_idx = 0
-        for i, row in enumerate(raw_rows[:5]):
+        for i, row in enumerate(head_rows[:5]):
             if sum(1 for c in row if c is not None) >= 2:
                 header_idx = i
                 break
 
-        headers = [str(c).strip() if c is not None else "" for c in raw_rows[header_idx]]
-        data_rows = raw_rows[header_idx + 1:]
-        if not data_rows:
+        # header_idx < 5 < _HEAD_ROWS, so a short head means the sheet is exhausted
+        if len(head_rows) == header_idx + 1:
             continue
+        headers = [str(c).strip() if c is not None else "" for c in head_rows[header_idx]]
+        data_rows = chain(head_rows[header_idx + 1:], rows_iter)
 
         req_col   = _col_index(headers, _REQ_KW)
         compl_col = _col_index(headers, _COMPL_KW)
@@ -227,32 +417,20 @@ def parse_bid_response_excel(file_bytes: bytes, filename: str) -> str:
         if req_col == -1 or compl_col == -1:
             # Fallback: dump first 60 rows as plain text so the AI can still read it
             rows_text = []
-            for row in raw_rows[:60]:
+            for row in head_rows:
                 cells = [str(c) if c is not None else "" for c in row]
                 line = " | ".join(cells).strip()
                 if line.replace("|", "").strip():
                     rows_text.append(line)
-            all_sections.append(
-                f"[Sheet: {sheet.title}] (columns not auto-detected — raw dump)\n"
-                + "\n".join(rows_text)
-            )
+            if out.tell():
+                out.write("\n\n")
+            out.write(f"[Sheet: {sheet.title}] (columns not auto-detected — raw dump)\n")
+            out.write("\n".join(rows_text))
             continue
 
-        # Bucket rows by compliance + mandatory status
-        mand_no:      List[str] = []
-        mand_partial: List[str] = []
-        mand_yes:     List[str] = []
-        opt_no:       List[str] = []
-        opt_partial:  List[str] = []
-
-        def _row_line(row, req_col, compl_col, note_col, headers) -> str:
-            req_text  = _norm(row[req_col])   if req_col  < len(row) else ""
-            note_text = _norm(row[note_col])  if note_col != -1 and note_col < len(row) else ""
-            compl_raw = str(row[compl_col]).strip() if compl_col < len(row) and row[compl_col] is not None else ""
-            line = f"• [{compl_raw}] {req_text}"
-            if note_text and note_text not in ("none", "nan", ""):
-                line += f"  → Note: {note_text}"
-            return line
+        # Bucket rows by compliance + mandatory status (indexed by _classify code)
+        buckets: List[List[str]] = [[] for _ in range(_N_BUCKETS)]
+        n_mand_yes = 0
 
         for row in data_rows:
             if all(c is None for c in row):
@@ -260,68 +438,63 @@ def parse_bid_response_excel(file_bytes: bytes, filename: str) -> str:
             compl_raw  = _norm(row[compl_col]) if compl_col < len(row) else ""
             mand_raw   = _norm(row[mand_col])  if mand_col != -1 and mand_col < len(row) else "m"
 
-            is_mand    = any(kw in mand_raw for kw in _VAL_MAND) if mand_raw else True
-            is_no      = compl_raw in _VAL_NO      or any(v == compl_raw for v in _VAL_NO)
-            is_partial = compl_raw in _VAL_PARTIAL or any(v in compl_raw for v in ("partial", "parzial", "in parte"))
-            is_yes     = compl_raw in _VAL_YES     or any(v == compl_raw for v in _VAL_YES)
+            code = _classify(compl_raw, mand_raw)
+            if code == _SKIP:
+                continue
+            if code == _MAND_YES:
+                # Confirmed capabilities are only counted beyond the examples shown
+                n_mand_yes += 1
+                if n_mand_yes > _MAX_YES_EXAMPLES:
+                    continue
+
+            buckets[code].append(_row_line(row, req_col, compl_col, note_col))
 
-            line = _row_line(row, req_col, compl_col, note_col, headers)
+        mand_no, mand_partial, mand_yes = buckets[_MAND_NO], buckets[_MAND_PARTIAL], buckets[_MAND_YES]
+        opt_no, opt_partial             = buckets[_OPT_NO], buckets[_OPT_PARTIAL]
 
-            if is_mand:
-                if is_no:
-                    mand_no.append(line)
-                elif is_partial:
-                    mand_partial.append(line)
-                elif is_yes:
-                    mand_yes.append(line)
-            else:
-                if is_no:
-                    opt_no.append(line)
-                elif is_partial:
-                    opt_partial.append(line)
+        if not (mand_no or mand_partial or opt_no or opt_partial or mand_yes):
+            continue
 
-        parts: List[str] = [f"[Sheet: {sheet.title}]"]
+        if out.tell():
+            out.write("\n\n")
+        out.write(f"[Sheet: {sheet.title}]")
 
         if mand_no:
-            parts.append(
-                "MANDATORY — NOT COMPLIANT (N): Inpeco COULD NOT meet these requirements.\n"
+            out.write(
+                "\n\nMANDATORY — NOT COMPLIANT (N): Inpeco COULD NOT meet these requirements.\n"
                 "These reveal CAPABILITY GAPS — flag as HIGH risk if the current tender asks for similar things.\n"
-                + "\n".join(mand_no)
             )
+            out.write("\n".join(mand_no))
         if mand_partial:
-            parts.append(
-                "MANDATORY — PARTIALLY COMPLIANT: Inpeco only partially met these.\n"
+            out.write(
+                "\n\nMANDATORY — PARTIALLY COMPLIANT: Inpeco only partially met these.\n"
                 "These reveal KNOWN WEAKNESSES — flag as MEDIUM-HIGH risk if similar requirements appear.\n"
-                + "\n".join(mand_partial)
             )
+            out.write("\n".join(mand_partial))
         if opt_no:
-            parts.append(
-                "OPTIONAL — NOT COMPLIANT (N): Inpeco could not meet these optional requirements.\n"
-                + "\n".join(opt_no)
+            out.write(
+                "\n\nOPTIONAL — NOT COMPLIANT (N): Inpeco could not meet these optional requirements.\n"
             )
+            out.write("\n".join(opt_no))
         if opt_partial:
-            parts.append(
-                "OPTIONAL — PARTIALLY COMPLIANT:\n"
-                + "\n".join(opt_partial)
-            )
+            out.write("\n\nOPTIONAL — PARTIALLY COMPLIANT:\n")
+            out.write("\n".join(opt_partial))
         if mand_yes:
             # Include confirmed capabilities but keep it compact
-            parts.append(
-                f"MANDATORY — COMPLIANT (Y): {len(mand_yes)} mandatory requirements met. "
+            out.write(
+                f"\n\nMANDATORY — COMPLIANT (Y): {n_mand_yes} mandatory requirements met. "
                 "Key examples:\n"
-                + "\n".join(mand_yes[:20])
-                + ("\n  (…and more)" if len(mand_yes) > 20 else "")
             )
-
-        if len(parts) > 1:
-            all_sections.append("\n\n".join(parts))
+            out.write("\n".join(mand_yes))
+            if n_mand_yes > _MAX_YES_EXAMPLES:
+                out.write("\n  (…and more)")
 
     wb.close()
 
-    if not all_sections:
+    if not out.tell():
         return f"(No compliance data found in {filename})"
 
-    return "\n\n".join(all_sections)
+    return out.getvalue()
 
 
 def _extract_text(file_bytes: bytes) -> List[str]:
@@ -333,6 +506,25 @@ def _extract_text(file_bytes: bytes) -> List[str]:
 
 SUPPORTED_EXTENSIONS = {"pdf", "docx", "xlsx", "xls", "txt", "csv", "tsv", "md"}
 
+# ext → (extractor, message if both it and the plain-text fallback fail).
+# A None message means no fallback: errors surface as "Unexpected error".
+# Extensions not listed here are read as plain text.
+_EXTRACTORS = {
+    "pdf":  (_extract_pdf,  None),
+    "docx": (_extract_docx, "not a valid DOCX/ZIP file"),
+    "xlsx": (_extract_xlsx, "not a valid spreadsheet file"),
+    "xls":  (_extract_xlsx, "not a valid spreadsheet file"),
+}
+
+
+# Prefixes of the warning strings returned when a file cannot be read at all
+_ERROR_PREFIXES = ("(Could not ", "(Unexpected error ")
+
+
+def is_extraction_error(text: str) -> bool:
+    """True if text is a failure message from extract_from_file or parse_bid_response_excel."""
+    return text.startswith(_ERROR_PREFIXES)
+
 
 def extract_from_file(file_bytes: bytes, filename: str) -> List[str]:
     """
@@ -342,42 +534,21 @@ def extract_from_file(file_bytes: bytes, filename: str) -> List[str]:
 
     Supported: .pdf, .docx, .xlsx, .xls, .txt, .csv, .tsv, .md
     """
-    import zipfile
-
     ext = filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
+    extractor, fallback_msg = _EXTRACTORS.get(ext, (_extract_text, None))
 
     try:
-        if ext == "pdf":
-            return _extract_pdf(file_bytes)
-
-        elif ext == "docx":
-            try:
-                return _extract_docx(file_bytes)
-            except (zipfile.BadZipFile, Exception):
-                # Fallback: file may be an old .doc binary or corrupted —
-                # try to salvage whatever readable text is present.
-                try:
-                    return _extract_text(file_bytes)
-                except Exception:
-                    return [f"(Could not extract text from {filename}: not a valid DOCX/ZIP file)"]
-
-        elif ext in ("xlsx", "xls"):
-            try:
-                return _extract_xlsx(file_bytes)
-            except (zipfile.BadZipFile, Exception):
-                try:
-                    return _extract_text(file_bytes)
-                except Exception:
-                    return [f"(Could not extract text from {filename}: not a valid spreadsheet file)"]
-
-        elif ext in ("txt", "csv", "tsv", "md"):
-            return _extract_text(file_bytes)
-
-        else:
+        if fallback_msg is None:
+            return extractor(file_bytes)
+        try:
+            return extractor(file_bytes)
+        except (zipfile.BadZipFile, Exception):
+            # Fallback: file may be an old binary format or corrupted —
+            # try to salvage whatever readable text is present.
             try:
                 return _extract_text(file_bytes)
             except Exception:
-                return [f"(Could not extract text from: {filename})"]
+                return [f"(Could not extract text from {filename}: {fallback_msg})"]
 
     except Exception as exc:
         return [f"(Unexpected error reading {filename}: {exc})"]
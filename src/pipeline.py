@@ -1,23 +1,34 @@
 """
 pipeline.py — AI-powered tender analysis for TLA/IVD tenders.
-Replaces all rule-based heuristics with structured GPT-4o analysis
+Replaces all rule-based heuristics with structured GPT-4o / GPT-4o-mini analysis
 driven by a configurable risk_factors.json file.
 """
 from __future__ import annotations
 
+import gzip
+import hashlib
 import json
+import logging
 import os
 import re as _re
-from collections import Counter
-from typing import Any, Dict, List
-
-import fitz  # PyMuPDF
-from openai import OpenAI, RateLimitError
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Dict, List, Tuple
 
 from .extractors import chunk_pages, extract_raw_text, guess_title_and_date
+from .extractors import iter_pdf_pages, read_pdf_pages  # noqa: F401  (re-exported)
+
+if TYPE_CHECKING:
+    from openai import OpenAI
 
 # ─── OpenAI client (lazy init) ────────────────────────────────────
+# openai is imported on first use so the app and the risk-register helpers
+# start without paying for the SDK import.
 _client: OpenAI | None = None
+_MAX_RETRIES = 4
+_TIMEOUT_S = 600.0   # the SDK default; High-detail calls get longer, see _REQUEST_TIMEOUT_S
 
 
 def _get_client() -> OpenAI:
@@ -26,16 +37,67 @@ def _get_client() -> OpenAI:
         api_key = os.environ.get("OPENAI_API_KEY", "")
         if not api_key:
             raise ValueError("OPENAI_API_KEY environment variable not set.")
-        _client = OpenAI(api_key=api_key)
+        from openai import OpenAI
+        # The SDK retries connection errors, timeouts, 429s and 5xx with
+        # exponential backoff (honouring Retry-After); its default is 2 retries.
+        _client = OpenAI(api_key=api_key, max_retries=_MAX_RETRIES, timeout=_TIMEOUT_S)
     return _client
 
 
-# ─── PDF reading ──────────────────────────────────────────────────
-
-def read_pdf_pages(pdf_bytes: bytes) -> List[str]:
-    """Extract text from each page of a PDF."""
-    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-    return [doc[i].get_text("text") for i in range(len(doc))]
+# ─── Client-side rate pacing ──────────────────────────────────────
+#
+# Off unless OPENAI_TPM_LIMIT and/or OPENAI_RPM_LIMIT are set to the account's
+# limits. Concurrent analyses (build_prebid_reports) then wait for room in the
+# 60 s window instead of hitting 429s and shrinking the document.
+
+class _RateLimiter:
+    """Sliding 60-second window over requests and estimated tokens, shared by threads."""
+
+    def __init__(self, tpm: int = 0, rpm: int = 0) -> None:
+        self.tpm = tpm
+        self.rpm = rpm
+        self._events: deque = deque()   # (timestamp, tokens)
+        self._tokens = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: int) -> None:
+        if not (self.tpm or self.rpm):
+            return
+        # A single request larger than the whole budget can only wait for an empty window
+        tokens = min(tokens, self.tpm) if self.tpm else tokens
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                while self._events and now - self._events[0][0] >= 60:
+                    self._tokens -= self._events.popleft()[1]
+                fits = ((not self.tpm or self._tokens + tokens <= self.tpm)
+                        and (not self.rpm or len(self._events) < self.rpm))
+                if fits:
+                    self._events.append((now, tokens))
+                    self._tokens += tokens
+                    return
+                wait = 60 - (now - self._events[0][0])
+            time.sleep(max(wait, 0.05))
+
+
+def _env_limit(name: str) -> int:
+    """Read a rate limit from the environment; unset or malformed means 0 (off)."""
+    raw = os.environ.get(name, "").strip()
+    if not raw:
+        return 0
+    try:
+        return max(0, int(raw))
+    except ValueError:
+        logging.getLogger(__name__).warning(
+            "Ignoring %s=%r: expected a whole number such as 30000", name, raw,
+        )
+        return 0
+
+
+_rate_limiter = _RateLimiter(
+    tpm=_env_limit("OPENAI_TPM_LIMIT"),
+    rpm=_env_limit("OPENAI_RPM_LIMIT"),
+)
 
 
 # ─── Risk factors loader ──────────────────────────────────────────
@@ -64,88 +126,120 @@ def load_risk_factors(path: str | None = None) -> Dict[str, Any]:
 
 # ─── Knowledge context loader (disk fallback) ─────────────────────
 
-def _load_knowledge_context_from_disk(
+_KNOWLEDGE_FOLDERS = [
+    ("assets/knowledge/responses", "PAST BID RESPONSE — Inpeco"),
+    # backward-compat with old won/lost folders
+    ("assets/knowledge/won",  "PAST BID RESPONSE (won) — Inpeco"),
+    ("assets/knowledge/lost", "PAST BID RESPONSE (lost) — Inpeco"),
+]
+
+# (limits, file state) → assembled text; holds only the latest state
+_knowledge_cache: Dict[tuple, str] = {}
+
+
+# Parsed text of each knowledge file, persisted across restarts. Keyed by the
+# file's name and content hash (the Excel summary quotes the file name); bump
+# the version when the parsers change their output.
+_KNOWLEDGE_PARSE_DIR = os.path.join(_ASSETS_DIR, ".cache", "knowledge")
+_KNOWLEDGE_PARSE_VERSION = "2"
+
+
+def _parsed_knowledge_path(raw: bytes, filename: str) -> str:
+    digest = hashlib.sha1(filename.encode("utf-8") + b"\0" + raw).hexdigest()
+    return os.path.join(_KNOWLEDGE_PARSE_DIR, f"{digest}.v{_KNOWLEDGE_PARSE_VERSION}.txt.gz")
+
+
+def _read_parsed_knowledge(raw: bytes, filename: str) -> str | None:
+    try:
+        with gzip.open(_parsed_knowledge_path(raw, filename), "rt", encoding="utf-8") as fh:
+            return fh.read()
+    except (OSError, EOFError):
+        return None
+
+
+def _write_parsed_knowledge(raw: bytes, filename: str, text: str) -> None:
+    path = _parsed_knowledge_path(raw, filename)
+    try:
+        os.makedirs(_KNOWLEDGE_PARSE_DIR, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with gzip.open(tmp, "wt", encoding="utf-8") as fh:
+            fh.write(text)
+        os.replace(tmp, path)
+    except OSError:
+        pass
+
+
+def load_knowledge_context(
     max_chars_per_file: int = 20_000,
     max_total: int = 80_000,
 ) -> str:
     """Load past-bid documents from the knowledge folders and return as a single string.
-    Excel compliance matrices are parsed with the dedicated parser."""
-    import glob as _glob
-    from .extractors import parse_bid_response_excel, extract_from_file
+    Excel compliance matrices are parsed with the dedicated parser.
 
-    chunks: list[str] = []
-    total = 0
-    folder_labels = [
-        ("assets/knowledge/responses", "PAST BID RESPONSE"),
-        ("assets/knowledge/won",  "PAST BID RESPONSE (won)"),
-        ("assets/knowledge/lost", "PAST BID RESPONSE (lost)"),
-    ]
-    for folder, label in folder_labels:
-        if not os.path.isdir(folder):
+    The result is cached per process, keyed on the path, mtime and size of
+    every file, so adding, replacing or deleting a document invalidates it."""
+    from .extractors import extract_from_file, is_extraction_error, parse_bid_response_excel
+
+    # One scandir per folder; the stat of each entry is reused for the cache key
+    files = []
+    state = []
+    for folder, label in _KNOWLEDGE_FOLDERS:
+        try:
+            with os.scandir(folder) as it:
+                entries = sorted(
+                    (e for e in it if not e.name.startswith(".") and e.is_file()),
+                    key=lambda e: e.name,
+                )
+        except OSError:
             continue
-        for fpath in sorted(_glob.glob(os.path.join(folder, "*"))):
-            if total >= max_total:
-                break
-            fn = os.path.basename(fpath)
-            ext = fn.rsplit(".", 1)[-1].lower() if "." in fn else ""
+        for entry in entries:
             try:
-                with open(fpath, "rb") as fh:
-                    raw = fh.read()
+                st = entry.stat()
+            except OSError:
+                continue
+            files.append((label, entry.path))
+            state.append((entry.path, st.st_mtime_ns, st.st_size))
+    key = (max_chars_per_file, max_total, tuple(state))
+    if key in _knowledge_cache:
+        return _knowledge_cache[key]
+
+    chunks: list[str] = []
+    total = 0
+    for label, fpath in files:
+        if total >= max_total:
+            break
+        fn = os.path.basename(fpath)
+        ext = fn.rsplit(".", 1)[-1].lower() if "." in fn else ""
+        try:
+            with open(fpath, "rb") as fh:
+                raw = fh.read()
+            text = _read_parsed_knowledge(raw, fn)
+            if text is None:
                 if ext in ("xlsx", "xls"):
                     text = parse_bid_response_excel(raw, fn)
                 else:
                     pages = extract_from_file(raw, fn)
                     text = "\n".join(pages)
-                text = text[:max_chars_per_file]
-                chunks.append(f"=== {label}: {fn} ===\n{text}")
-                total += len(text)
-            except Exception:
-                continue
-    return "\n\n".join(chunks)
-
-
-# ─── AI prompt builder ────────────────────────────────────────────
-
-def _build_system_prompt(risk_factors: Dict[str, Any], knowledge_context: str = "") -> str:
-    company = risk_factors.get("company_profile", {})
-
-    knowledge_section = ""
-    if knowledge_context.strip():
-        knowledge_section = f"""
-
-PAST BID COMPLIANCE DATA — INPECO'S HISTORICAL ANSWERS:
-The following data is extracted from Inpeco's compliance matrices in past tender responses
-(Excel files with requirement lists, Y/N/partially columns, mandatory/optional flags).
-
-HOW TO READ THIS DATA:
-- "MANDATORY — NOT COMPLIANT (N)": requirements Inpeco COULD NOT meet in a past bid.
-  These are CONFIRMED CAPABILITY GAPS. If the current tender contains similar requirements,
-  you MUST flag them as HIGH risk or SHOWSTOPPER and explicitly reference the past gap.
-- "MANDATORY — PARTIALLY COMPLIANT": requirements Inpeco only partially met.
-  These are KNOWN WEAKNESSES. Flag as MEDIUM-HIGH risk if similar requirements appear.
-- "OPTIONAL — NOT COMPLIANT / PARTIAL": lower-priority gaps, still worth noting.
-- "MANDATORY — COMPLIANT (Y)": confirmed capabilities; use to reassure where relevant.
-
-INSTRUCTIONS:
-1. Cross-reference EVERY requirement in the current tender against these past gaps.
-2. When you find a match or similarity, say so explicitly in the risk evidence and rationale:
-   e.g. "In past bid [filename], Inpeco answered N to a similar connectivity requirement."
-3. Treat recurring N/partial patterns as systemic limitations, not one-off cases.
-4. Do NOT use hedged language if the data clearly shows a gap — be direct.
+                # A failed parse may be transient; do not pin it in the cache
+                if not is_extraction_error(text):
+                    _write_parsed_knowledge(raw, fn, text)
+            text = text[:max_chars_per_file]
+            chunks.append(f"=== {label}: {fn} ===\n{text}")
+            total += len(text)
+        except Exception:
+            continue
 
-{knowledge_context}
+    result = "\n\n".join(chunks)
+    _knowledge_cache.clear()
+    _knowledge_cache[key] = result
+    return result
 
-END OF PAST BID COMPLIANCE DATA
-"""
 
-    return f"""You are an expert pre-bid tender analyst for {company.get("name", "the company")}.
+# ─── AI prompt builder ────────────────────────────────────────────
 
-COMPANY PROFILE:
-- Business: {company.get("business_description", "Clinical laboratory automation supplier")}
-- Products: {", ".join(company.get("products", []))}
-- Typical delivery time: {company.get("typical_delivery_months", "N/A")} months
-- Geographic coverage: {", ".join(company.get("geographic_coverage", []))}
-- Languages handled: {", ".join(company.get("languages", ["English"]))}
+# Instructions shared by every analysis — kept as a plain constant, never reformatted.
+_SYSTEM_PROMPT_STATIC = """You are an expert pre-bid tender analyst for the company described under COMPANY PROFILE
+at the end of these instructions.
 
 YOUR TASK:
 Analyze the tender document provided and produce a structured pre-bid screening report.
@@ -173,9 +267,6 @@ TENDER TYPE CLASSIFICATION — READ CAREFULLY AND APPLY STRICTLY:
 
 - "unknown": Insufficient information in the document to determine type.
 
-RISK REGISTER TO APPLY:
-{json.dumps(risk_factors.get("risk_register", {}), indent=2, ensure_ascii=False)}
-{knowledge_section}
 ANTI-HALLUCINATION RULES — NON-NEGOTIABLE:
 1. Extract ONLY information EXPLICITLY stated in the tender document.
    Do NOT infer, assume, or fill in typical industry values when the document is silent.
@@ -190,97 +281,10 @@ ANTI-HALLUCINATION RULES — NON-NEGOTIABLE:
 6. Do NOT repeat or paraphrase the risk register definitions — only report what is IN THE TENDER.
 
 RESPONSE FORMAT:
-You MUST respond with a valid JSON object. No markdown, no explanation outside JSON.
-Use exactly this structure:
-
-{{
-  "tender_title": "string",
-  "tender_date": "string or empty",
-  "tender_reference": "string or empty",
-  "contracting_authority": "string",
-  "city": "string (city where contracting authority is located, or empty)",
-  "country": "string (country, e.g. Italy, France, or empty)",
-  "tender_type": "bundle | unbundle | unknown",
-  "estimated_value_eur": "string or empty",
-  "submission_deadline": "string or empty",
-  "executive_summary": ["string", "string", "string"],
-  "go_nogo": {{
-    "recommendation": "GO | GO with Mitigation | NO-GO",
-    "score": 0,
-    "rationale": "string"
-  }},
-  "showstoppers": [
-    {{
-      "id": "string",
-      "description": "string",
-      "evidence": "string (direct quote or paraphrase)",
-      "document_ref": "string (e.g. 'Technical Specs, p.12, §3.4')",
-      "impact": "string"
-    }}
-  ],
-  "risks": [
-    {{
-      "id": "string",
-      "risk": "string",
-      "category": "string",
-      "level": "Low | Medium | High",
-      "score": 50,
-      "document_ref": "string (e.g. 'Tender Doc, p.8, §2.3 – Connectivity')",
-      "evidence": "string (direct quote or paraphrase)",
-      "mitigation": "string"
-    }}
-  ],
-  "requirements": {{
-    "scope_and_responsibility": ["EXHAUSTIVE list — extract EVERY explicit scope item: what is included, what is excluded, who is responsible for civil works, electrical, pneumatic, dismantling, training, go-live support. Quote the document where relevant."],
-    "space_and_facility": ["EXHAUSTIVE list — extract ALL spatial constraints: room dimensions, available m², floor load, ceiling height, door widths, number of floors/buildings involved, available electrical power, compressed air availability, HVAC requirements."],
-    "analyzer_connectivity": ["EXHAUSTIVE list — name EVERY analyzer/instrument mentioned with brand and model if stated. Distinguish between analyzers to be connected (unbundle) vs supplied (bundle). Note specialties: clinical chemistry, immunoassay, hematology, coagulation, urinalysis, microbiology, molecular, blood gas, etc."],
-    "it_and_middleware": ["EXHAUSTIVE list — LIS/HIS name and version if stated, HL7/ASTM/FHIR requirements, cybersecurity requirements, GDPR obligations, remote access requirements, server supply obligations, network requirements."],
-    "schedule_and_milestones": ["EXHAUSTIVE list — ALL dates and timelines: contract signature, site survey, delivery, installation start/end, go-live, acceptance testing, warranty period start/end. Include phased rollout if present."],
-    "qualification_and_compliance": ["EXHAUSTIVE list — ALL certifications, regulatory approvals, standards required: CE marking, ISO standards (9001/13485/27001/62443), local ministry approvals, IQ/OQ/PQ validation, accreditation requirements (ISO 15189, CAP), GMP requirements."],
-    "commercial_conditions": ["EXHAUSTIVE list — payment terms, penalty/liquidated damages clauses (amount and trigger), performance bonds, bank guarantees, warranty duration, SLA uptime % required, spare parts obligations, insurance requirements, exclusivity clauses."]
-  }},
-  "deliverables": ["EXHAUSTIVE list — list EVERY document, report, plan, certificate, training session, and formal deliverable explicitly requested in the tender. Include: technical offer, pricing schedule, compliance matrix, project plan, site survey report, FAT/SAT protocols, installation report, training plan, O&M manuals, validation documentation, as-built drawings, etc."],
-  "open_questions": ["string"],
-  "deadlines": [
-    {{
-      "milestone": "string",
-      "when": "string",
-      "evidence": "string"
-    }}
-  ],
-  "tender_overview": {{
-    "service_installation_support": {{
-      "summary": "2-4 sentence narrative covering the overall installation and service picture: who does what, key timeline, SLA level required, training obligations.",
-      "key_points": [
-        "Exhaustive bullets. Cover: site survey obligations and timing; installation responsibility (Inpeco, subcontractor, hospital); dismantling/removal of existing equipment; go-live support duration; acceptance testing procedure (FAT/SAT/IQ/OQ/PQ); SLA uptime % required; response time for faults (critical vs standard); spare parts obligations; maintenance contract type (full-risk, time & material, preventive); warranty duration and start trigger; training: who is trained, how many sessions, on-site vs remote; documentation to deliver (manuals, as-built drawings, validation dossiers); post-go-live hypercare period if stated."
-      ]
-    }},
-    "it_software": {{
-      "summary": "2-4 sentence narrative on the IT integration complexity: LIS/middleware involved, protocol requirements, cybersecurity obligations, any server supply.",
-      "key_points": [
-        "Exhaustive bullets. Cover: LIS name and version (if stated); HIS name (if stated); middleware platform name (if stated); communication protocols required (HL7 version, ASTM, FHIR, proprietary); message types required (order, result, status, ADT); bidirectional vs unidirectional interface; cybersecurity requirements (ISO 27001, IEC 62443, NIS2, penetration testing, DPIA); GDPR/data-residency obligations; remote access requirements (VPN, jump server, whitelisting); server/hardware to supply (specs if stated); network requirements (dedicated VLAN, bandwidth, latency); software validation requirements (IQ/OQ/PQ for software modules); software certification (CE IVD, FDA 510k, MDR if applicable); update/patch management obligations; disaster recovery / backup requirements."
-      ]
-    }},
-    "commercial_legal_finance": {{
-      "summary": "2-4 sentence narrative on the commercial and contractual profile: contract value, payment structure, main financial risks (penalties, bonds), applicable law.",
-      "key_points": [
-        "Exhaustive bullets. Cover: estimated contract value (total and per lot if applicable); payment terms (advance, milestone-based, on delivery, on acceptance); penalty/liquidated damages clauses (trigger event, amount per day/week, cap); performance bond or bank guarantee (%, duration, issuer requirements); insurance requirements (PI, public liability, amounts); warranty duration and scope; SLA financial penalties (if uptime SLA is missed); contract duration (if service/rental model); renewal/extension options; exclusivity clauses; applicable law and jurisdiction; dispute resolution mechanism (arbitration, court, ADR); price revision/indexation clauses; import/export restrictions or custom duties if cross-border; subcontracting restrictions."
-      ]
-    }},
-    "layout_building_utilities": {{
-      "summary": "2-4 sentence narrative on the physical installation environment: available space, building constraints, utilities available, civil works scope.",
-      "key_points": [
-        "Exhaustive bullets. Cover: total available floor area (m²) and dimensions of the lab/room; ceiling height; floor load capacity (kg/m²); door widths and corridor widths for equipment access; number of floors or buildings involved; elevator availability and dimensions; electrical supply available (kVA, phases, voltage, UPS); compressed air availability (bar, flow rate, dedicated line or shared); HVAC / air conditioning in the lab; drainage requirements; civil works scope (who pays, who executes: false floors, cable trays, partitions); pneumatic tube system (existing, to install, brand); fire safety and regulatory constraints for the lab space; any asbestos or structural survey requirements."
-      ]
-    }},
-    "solution_clinical_workflow": {{
-      "summary": "2-4 sentence narrative on the clinical and workflow requirements: what the automation must achieve clinically, throughput, tube types, analyzers to connect or supply.",
-      "key_points": [
-        "Exhaustive bullets. Cover: automation solution scope (pre-analytical only, full-track, post-analytical); required throughput (tubes/hour, peak load); tube types handled (primary, secondary, aliquots, caps on/off); sample types (serum, plasma, urine, CSF, blood, other); clinical specialties to serve (clinical chemistry, immunoassay, hematology, coagulation, urinalysis, microbiology, molecular, blood gas, toxicology, genetics); STAT workflow requirements (dedicated STAT lane, priority routing); centrifugation requirements (on-track centrifuge, number, RPM, temperature); decapping/recapping requirements; aliquoting requirements (number of daughters, volume); refrigerated storage (number of positions, temperature); sorting and routing logic complexity; analyzer list: brand + model + specialty for each (specify if to connect or to supply); consolidation requirement (replacing existing instruments with new ones); interfacing to legacy analyzers (specify if connectivity is known/certified); specific clinical protocols required (e.g. reflex testing, delta-check, ASAP routing)."
-      ]
-    }}
-  }}
-}}
+Respond with the JSON report defined by the response schema. The description of each field
+in the schema says what it must contain. Use an empty string for text fields the document
+does not state (unless a rule below says to infer them) and an empty list for lists with
+nothing to report.
 
 FIELD EXTRACTION RULES — APPLY TO EVERY ANALYSIS:
 - city: Extract the city where the contracting authority/hospital is located. Look in: letterhead,
@@ -355,7 +359,7 @@ deliverables:
   - Note the format required (electronic, paper, number of copies) if stated.
 
 tender_overview — 5 DOMAIN SECTIONS (all mandatory even if some info is missing):
-  Replace the single-string placeholder in each key_points array with REAL exhaustive bullets.
+  Fill each key_points array with REAL exhaustive bullets.
   Each section must be self-contained: a reader who only looks at one section must understand
   everything relevant to that domain without reading the rest of the report.
 
@@ -389,32 +393,85 @@ tender_overview — 5 DOMAIN SECTIONS (all mandatory even if some info is missin
       refrigerated storage, analyzer list (brand + model + specialty + connect/supply), legacy
       interfacing, consolidation, specific clinical protocols (reflex, delta-check, ASAP).
     - List EVERY analyzer mentioned with its role (to connect vs to supply).
+
+"""
+
+
+# Wraps the knowledge-base text when one is supplied
+_KNOWLEDGE_HEADER = """
+
+PAST BID COMPLIANCE DATA — INPECO'S HISTORICAL ANSWERS:
+The following data is extracted from Inpeco's compliance matrices in past tender responses
+(Excel files with requirement lists, Y/N/partially columns, mandatory/optional flags).
+
+HOW TO READ THIS DATA:
+- "MANDATORY — NOT COMPLIANT (N)": requirements Inpeco COULD NOT meet in a past bid.
+  These are CONFIRMED CAPABILITY GAPS. If the current tender contains similar requirements,
+  you MUST flag them as HIGH risk or SHOWSTOPPER and explicitly reference the past gap.
+- "MANDATORY — PARTIALLY COMPLIANT": requirements Inpeco only partially met.
+  These are KNOWN WEAKNESSES. Flag as MEDIUM-HIGH risk if similar requirements appear.
+- "OPTIONAL — NOT COMPLIANT / PARTIAL": lower-priority gaps, still worth noting.
+- "MANDATORY — COMPLIANT (Y)": confirmed capabilities; use to reassure where relevant.
+
+INSTRUCTIONS:
+1. Cross-reference EVERY requirement in the current tender against these past gaps.
+2. When you find a match or similarity, say so explicitly in the risk evidence and rationale:
+   e.g. "In past bid [filename], Inpeco answered N to a similar connectivity requirement."
+3. Treat recurring N/partial patterns as systemic limitations, not one-off cases.
+4. Do NOT use hedged language if the data clearly shows a gap — be direct.
+
+"""
+_KNOWLEDGE_FOOTER = "\n\nEND OF PAST BID COMPLIANCE DATA\n"
+
+
+def _build_system_prompt(risk_factors: Dict[str, Any], knowledge_context: str = "") -> str:
+    # Static instructions first, company-specific data last: OpenAI caches prompts by
+    # exact prefix (≥ 1024 tokens), so everything that varies between setups
+    # (profile, risk register, knowledge base) must come after _SYSTEM_PROMPT_STATIC.
+    company = risk_factors.get("company_profile", {})
+
+    knowledge_section = ""
+    if knowledge_context.strip():
+        knowledge_section = _KNOWLEDGE_HEADER + knowledge_context + _KNOWLEDGE_FOOTER
+
+    return _SYSTEM_PROMPT_STATIC + f"""COMPANY PROFILE — {company.get("name", "the company")}:
+- Business: {company.get("business_description", "Clinical laboratory automation supplier")}
+- Products: {", ".join(company.get("products", []))}
+- Typical delivery time: {company.get("typical_delivery_months", "N/A")} months
+- Geographic coverage: {", ".join(company.get("geographic_coverage", []))}
+- Languages handled: {", ".join(company.get("languages", ["English"]))}
+
+RISK REGISTER TO APPLY:
+{json.dumps(risk_factors.get("risk_register", {}), separators=(",", ":"), ensure_ascii=False)}
+{knowledge_section}
 """
 
 
+_DETAIL_INSTRUCTIONS = {
+    "Low": (
+        "Provide a focused analysis covering showstoppers, the top 5 risks, "
+        "and a concise executive summary. Apply the verbosity standards from the system prompt "
+        "even at this level — keep it concise but never vague."
+    ),
+    "Medium": (
+        "Provide a thorough analysis. Cover ALL risk categories, ALL requirement sections, "
+        "and ALL open questions. Apply the full verbosity standards from the system prompt. "
+        "The report should be detailed enough that a bid manager can make a go/no-go decision "
+        "without reading the original tender document."
+    ),
+    "High": (
+        "Provide the most exhaustive analysis possible. Extract every constraint, requirement, "
+        "risk, deadline, and open question. Leave nothing implicit. "
+        "Apply all verbosity standards from the system prompt to their maximum extent. "
+        "If the knowledge base contains past gaps relevant to ANY requirement in this tender, "
+        "reference them explicitly. The report will be used as the primary briefing document "
+        "for the bid team — completeness is more important than brevity."
+    ),
+}
+
+
 def _build_user_prompt(document_text: str, detail: str = "Medium") -> str:
-    detail_instructions = {
-        "Low": (
-            "Provide a focused analysis covering showstoppers, the top 5 risks, "
-            "and a concise executive summary. Apply the verbosity standards from the system prompt "
-            "even at this level — keep it concise but never vague."
-        ),
-        "Medium": (
-            "Provide a thorough analysis. Cover ALL risk categories, ALL requirement sections, "
-            "and ALL open questions. Apply the full verbosity standards from the system prompt. "
-            "The report should be detailed enough that a bid manager can make a go/no-go decision "
-            "without reading the original tender document."
-        ),
-        "High": (
-            "Provide the most exhaustive analysis possible. Extract every constraint, requirement, "
-            "risk, deadline, and open question. Leave nothing implicit. "
-            "Apply all verbosity standards from the system prompt to their maximum extent. "
-            "If the knowledge base contains past gaps relevant to ANY requirement in this tender, "
-            "reference them explicitly. The report will be used as the primary briefing document "
-            "for the bid team — completeness is more important than brevity."
-        ),
-    }
-    instruction = detail_instructions.get(detail, detail_instructions["Medium"])
+    instruction = _DETAIL_INSTRUCTIONS.get(detail, _DETAIL_INSTRUCTIONS["Medium"])
 
     return f"""TENDER DOCUMENT:
 {document_text}
@@ -440,19 +497,21 @@ _STOP_WORDS = frozenset({
     "al", "alla", "agli", "alle", "lo", "e", "o", "ma", "se",
 })
 
+# Stop-words are rejected inside the regex (negative lookahead) so findall
+# only yields significant words.
+_STOP_ALT = "|".join(sorted(map(_re.escape, _STOP_WORDS), key=len, reverse=True))
+_WORD_RE = _re.compile(rf'\b(?!(?:{_STOP_ALT})\b)[a-zA-Z0-9àèéìòùü]{{3,}}\b')
+
 
 def _fingerprint(text: str, n: int = 10) -> frozenset:
     """Significant-word fingerprint for fuzzy deduplication.
     Includes alphanumeric tokens so domain terms like HL7, ISO27001 are captured."""
-    words = _re.findall(r'\b[a-zA-Z0-9àèéìòùü]{3,}\b', str(text).lower())
-    sig = [w for w in words if w not in _STOP_WORDS][:n]
-    return frozenset(sig)
+    return frozenset(_WORD_RE.findall(str(text).lower())[:n])
 
 
-def _fuzzy_similar(a: str, b: str, threshold: int = 2) -> bool:
-    """True if two strings share at least `threshold` significant words.
-    Threshold=2 is intentionally conservative to avoid over-merging unrelated items."""
-    return len(_fingerprint(str(a)) & _fingerprint(str(b))) >= threshold
+# Two items are the same if their fingerprints share at least this many words.
+# 2 is intentionally conservative to avoid over-merging unrelated items.
+_MIN_SHARED_WORDS = 2
 
 
 def _merge_str_list(lists: list, min_runs: int = 1) -> list:
@@ -460,17 +519,21 @@ def _merge_str_list(lists: list, min_runs: int = 1) -> list:
     Union of string lists across runs, fuzzy-deduplicated by word overlap.
     Items found in more runs come first.
     """
-    groups: list = []  # [(canonical_text, run_count)]
+    groups: list = []  # [(canonical_text, fingerprint, run_count)]
     for lst in lists:
         for item in (lst or []):
             s = str(item)
-            for i, (canon, cnt) in enumerate(groups):
-                if _fuzzy_similar(s, canon):
-                    groups[i] = (s if len(s) > len(canon) else canon, cnt + 1)
+            fp = _fingerprint(s)
+            for i, (canon, canon_fp, cnt) in enumerate(groups):
+                if len(fp & canon_fp) >= _MIN_SHARED_WORDS:
+                    if len(s) > len(canon):
+                        groups[i] = (s, fp, cnt + 1)
+                    else:
+                        groups[i] = (canon, canon_fp, cnt + 1)
                     break
             else:
-                groups.append((s, 1))
-    filtered = [(t, c) for t, c in groups if c >= min_runs]
+                groups.append((s, fp, 1))
+    filtered = [(t, c) for t, _, c in groups if c >= min_runs]
     filtered.sort(key=lambda x: -x[1])
     return [t for t, _ in filtered]
 
@@ -480,36 +543,38 @@ def _merge_dict_list(lists: list, text_field: str, min_runs: int = 1) -> list:
     Union of dict lists across runs, deduplicated by text_field word similarity.
     Keeps the most detailed version of each item; items found in more runs come first.
     """
-    groups: list = []  # [(canonical_dict, run_count)]
+    groups: list = []  # [(canonical_dict, fingerprint, run_count)]
     for lst in lists:
         for item in (lst or []):
             if not isinstance(item, dict):
                 continue
-            text = str(item.get(text_field, ""))
-            for i, (canon, cnt) in enumerate(groups):
-                canon_text = str(canon.get(text_field, ""))
-                if _fuzzy_similar(text, canon_text):
+            fp = _fingerprint(str(item.get(text_field, "")))
+            for i, (canon, canon_fp, cnt) in enumerate(groups):
+                if len(fp & canon_fp) >= _MIN_SHARED_WORDS:
                     # Keep item with higher score, or more total content
                     item_score  = item.get("score",  0) or 0
                     canon_score = canon.get("score", 0) or 0
                     if item_score > canon_score or len(str(item)) > len(str(canon)):
-                        groups[i] = (item, cnt + 1)
+                        groups[i] = (item, fp, cnt + 1)
                     else:
-                        groups[i] = (canon, cnt + 1)
+                        groups[i] = (canon, canon_fp, cnt + 1)
                     break
             else:
-                groups.append((item, 1))
-    filtered = [(d, c) for d, c in groups if c >= min_runs]
+                groups.append((item, fp, 1))
+    filtered = [(d, c) for d, _, c in groups if c >= min_runs]
     filtered.sort(key=lambda x: -x[1])
     return [d for d, _ in filtered]
 
 
 def _most_common_val(values: list) -> str:
-    """Most common non-empty string value across a list."""
-    non_empty = [str(v).strip() for v in values if v and str(v).strip()]
-    if not non_empty:
-        return ""
-    return Counter(non_empty).most_common(1)[0][0]
+    """Most common non-empty string value across a list (ties: first seen wins)."""
+    counts: Counter = Counter()
+    for v in values:
+        if v:
+            text = str(v).strip()
+            if text:
+                counts[text] += 1
+    return counts.most_common(1)[0][0] if counts else ""
 
 
 def _merge_reports(reports: list) -> dict:
@@ -542,9 +607,10 @@ def _merge_reports(reports: list) -> dict:
     recs       = [r.get("go_nogo", {}).get("recommendation", "") for r in reports]
     rationales = [r.get("go_nogo", {}).get("rationale", "") for r in reports]
     rec_votes  = Counter(r for r in recs if r)
-    consensus_rec = rec_votes.most_common(1)[0][0] if rec_votes else "GO"
-    if "NO-GO" in recs:                  # safety-first: 1 NO-GO vote → NO-GO
+    if "NO-GO" in rec_votes:             # safety-first: 1 NO-GO vote → NO-GO
         consensus_rec = "NO-GO"
+    else:
+        consensus_rec = rec_votes.most_common(1)[0][0] if rec_votes else "GO"
     merged["go_nogo"] = {
         "recommendation": consensus_rec,
         "score":          round(sum(scores) / len(scores)),
@@ -613,11 +679,12 @@ def _merge_reports(reports: list) -> dict:
     merged["tender_overview"] = overview
 
     # Meta — summed token/cost stats
-    meta = dict(reports[-1].get("_meta", {}))
-    for token_field in ("prompt_tokens", "completion_tokens", "total_tokens"):
-        meta[token_field] = sum(r.get("_meta", {}).get(token_field, 0) for r in reports)
+    metas = [r.get("_meta") or {} for r in reports]
+    meta = dict(metas[-1])
+    for token_field in ("prompt_tokens", "cached_tokens", "completion_tokens", "total_tokens"):
+        meta[token_field] = sum(m.get(token_field, 0) for m in metas)
     meta["estimated_cost_usd"] = round(
-        sum(r.get("_meta", {}).get("estimated_cost_usd", 0) for r in reports), 4
+        sum(m.get("estimated_cost_usd", 0) for m in metas), 4
     )
     meta["runs"] = len(reports)
     merged["_meta"] = meta
@@ -625,87 +692,464 @@ def _merge_reports(reports: list) -> dict:
     return merged
 
 
+# ─── Report schema (structured outputs) ──────────────────────────
+#
+# Sent with strict=True, the model is constrained to this shape, so every key is
+# always present. Field descriptions are read by the model; they carry the
+# per-field guidance, the system prompt carries the analysis rules.
+
+def _obj(**props: Any) -> Dict[str, Any]:
+    return {
+        "type": "object",
+        "properties": props,
+        "required": list(props),
+        "additionalProperties": False,
+    }
+
+
+def _arr(items: Dict[str, Any], description: str = "") -> Dict[str, Any]:
+    schema: Dict[str, Any] = {"type": "array", "items": items}
+    if description:
+        schema["description"] = description
+    return schema
+
+
+def _str(description: str = "", enum: List[str] | None = None) -> Dict[str, Any]:
+    schema: Dict[str, Any] = {"type": "string"}
+    if enum:
+        schema["enum"] = enum
+    if description:
+        schema["description"] = description
+    return schema
+
+
+_STR = _str()
+
+
+def _section(summary: str, key_points: str) -> Dict[str, Any]:
+    return _obj(summary=_str(summary), key_points=_arr(_STR, key_points))
+
+
+_REPORT_SCHEMA: Dict[str, Any] = _obj(
+    tender_title=_STR,
+    tender_date=_str("Empty if not stated."),
+    tender_reference=_str("Empty if not stated."),
+    contracting_authority=_STR,
+    city=_str("City where the contracting authority is located, or empty."),
+    country=_str("Country, e.g. Italy, France, or empty."),
+    tender_type=_str(enum=["bundle", "unbundle", "unknown"]),
+    estimated_value_eur=_str("Empty if not stated."),
+    submission_deadline=_str("Empty if not stated."),
+    executive_summary=_arr(_STR),
+    go_nogo=_obj(
+        recommendation=_str(enum=["GO", "GO with Mitigation", "NO-GO"]),
+        score={"type": "integer"},
+        rationale=_STR,
+    ),
+    showstoppers=_arr(_obj(
+        id=_STR,
+        description=_STR,
+        evidence=_str("Direct quote or paraphrase."),
+        document_ref=_str("E.g. 'Technical Specs, p.12, §3.4'."),
+        impact=_STR,
+    )),
+    risks=_arr(_obj(
+        id=_STR,
+        risk=_STR,
+        category=_STR,
+        level=_str(enum=["Low", "Medium", "High"]),
+        score={"type": "integer"},
+        document_ref=_str("E.g. 'Tender Doc, p.8, §2.3 – Connectivity'."),
+        evidence=_str("Direct quote or paraphrase."),
+        mitigation=_STR,
+    )),
+    requirements=_obj(
+        scope_and_responsibility=_arr(_STR, "EXHAUSTIVE list — extract EVERY explicit scope item: what is included, what is excluded, who is responsible for civil works, electrical, pneumatic, dismantling, training, go-live support. Quote the document where relevant."),
+        space_and_facility=_arr(_STR, "EXHAUSTIVE list — extract ALL spatial constraints: room dimensions, available m², floor load, ceiling height, door widths, number of floors/buildings involved, available electrical power, compressed air availability, HVAC requirements."),
+        analyzer_connectivity=_arr(_STR, "EXHAUSTIVE list — name EVERY analyzer/instrument mentioned with brand and model if stated. Distinguish between analyzers to be connected (unbundle) vs supplied (bundle). Note specialties: clinical chemistry, immunoassay, hematology, coagulation, urinalysis, microbiology, molecular, blood gas, etc."),
+        it_and_middleware=_arr(_STR, "EXHAUSTIVE list — LIS/HIS name and version if stated, HL7/ASTM/FHIR requirements, cybersecurity requirements, GDPR obligations, remote access requirements, server supply obligations, network requirements."),
+        schedule_and_milestones=_arr(_STR, "EXHAUSTIVE list — ALL dates and timelines: contract signature, site survey, delivery, installation start/end, go-live, acceptance testing, warranty period start/end. Include phased rollout if present."),
+        qualification_and_compliance=_arr(_STR, "EXHAUSTIVE list — ALL certifications, regulatory approvals, standards required: CE marking, ISO standards (9001/13485/27001/62443), local ministry approvals, IQ/OQ/PQ validation, accreditation requirements (ISO 15189, CAP), GMP requirements."),
+        commercial_conditions=_arr(_STR, "EXHAUSTIVE list — payment terms, penalty/liquidated damages clauses (amount and trigger), performance bonds, bank guarantees, warranty duration, SLA uptime % required, spare parts obligations, insurance requirements, exclusivity clauses."),
+    ),
+    deliverables=_arr(_STR, "EXHAUSTIVE list — list EVERY document, report, plan, certificate, training session, and formal deliverable explicitly requested in the tender. Include: technical offer, pricing schedule, compliance matrix, project plan, site survey report, FAT/SAT protocols, installation report, training plan, O&M manuals, validation documentation, as-built drawings, etc."),
+    open_questions=_arr(_STR),
+    deadlines=_arr(_obj(milestone=_STR, when=_STR, evidence=_STR)),
+    tender_overview=_obj(
+        service_installation_support=_section(
+            "2-4 sentence narrative covering the overall installation and service picture: who does what, key timeline, SLA level required, training obligations.",
+            "Exhaustive bullets. Cover: site survey obligations and timing; installation responsibility (Inpeco, subcontractor, hospital); dismantling/removal of existing equipment; go-live support duration; acceptance testing procedure (FAT/SAT/IQ/OQ/PQ); SLA uptime % required; response time for faults (critical vs standard); spare parts obligations; maintenance contract type (full-risk, time & material, preventive); warranty duration and start trigger; training: who is trained, how many sessions, on-site vs remote; documentation to deliver (manuals, as-built drawings, validation dossiers); post-go-live hypercare period if stated.",
+        ),
+        it_software=_section(
+            "2-4 sentence narrative on the IT integration complexity: LIS/middleware involved, protocol requirements, cybersecurity obligations, any server supply.",
+            "Exhaustive bullets. Cover: LIS name and version (if stated); HIS name (if stated); middleware platform name (if stated); communication protocols required (HL7 version, ASTM, FHIR, proprietary); message types required (order, result, status, ADT); bidirectional vs unidirectional interface; cybersecurity requirements (ISO 27001, IEC 62443, NIS2, penetration testing, DPIA); GDPR/data-residency obligations; remote access requirements (VPN, jump server, whitelisting); server/hardware to supply (specs if stated); network requirements (dedicated VLAN, bandwidth, latency); software validation requirements (IQ/OQ/PQ for software modules); software certification (CE IVD, FDA 510k, MDR if applicable); update/patch management obligations; disaster recovery / backup requirements.",
+        ),
+        commercial_legal_finance=_section(
+            "2-4 sentence narrative on the commercial and contractual profile: contract value, payment structure, main financial risks (penalties, bonds), applicable law.",
+            "Exhaustive bullets. Cover: estimated contract value (total and per lot if applicable); payment terms (advance, milestone-based, on delivery, on acceptance); penalty/liquidated damages clauses (trigger event, amount per day/week, cap); performance bond or bank guarantee (%, duration, issuer requirements); insurance requirements (PI, public liability, amounts); warranty duration and scope; SLA financial penalties (if uptime SLA is missed); contract duration (if service/rental model); renewal/extension options; exclusivity clauses; applicable law and jurisdiction; dispute resolution mechanism (arbitration, court, ADR); price revision/indexation clauses; import/export restrictions or custom duties if cross-border; subcontracting restrictions.",
+        ),
+        layout_building_utilities=_section(
+            "2-4 sentence narrative on the physical installation environment: available space, building constraints, utilities available, civil works scope.",
+            "Exhaustive bullets. Cover: total available floor area (m²) and dimensions of the lab/room; ceiling height; floor load capacity (kg/m²); door widths and corridor widths for equipment access; number of floors or buildings involved; elevator availability and dimensions; electrical supply available (kVA, phases, voltage, UPS); compressed air availability (bar, flow rate, dedicated line or shared); HVAC / air conditioning in the lab; drainage requirements; civil works scope (who pays, who executes: false floors, cable trays, partitions); pneumatic tube system (existing, to install, brand); fire safety and regulatory constraints for the lab space; any asbestos or structural survey requirements.",
+        ),
+        solution_clinical_workflow=_section(
+            "2-4 sentence narrative on the clinical and workflow requirements: what the automation must achieve clinically, throughput, tube types, analyzers to connect or supply.",
+            "Exhaustive bullets. Cover: automation solution scope (pre-analytical only, full-track, post-analytical); required throughput (tubes/hour, peak load); tube types handled (primary, secondary, aliquots, caps on/off); sample types (serum, plasma, urine, CSF, blood, other); clinical specialties to serve (clinical chemistry, immunoassay, hematology, coagulation, urinalysis, microbiology, molecular, blood gas, toxicology, genetics); STAT workflow requirements (dedicated STAT lane, priority routing); centrifugation requirements (on-track centrifuge, number, RPM, temperature); decapping/recapping requirements; aliquoting requirements (number of daughters, volume); refrigerated storage (number of positions, temperature); sorting and routing logic complexity; analyzer list: brand + model + specialty for each (specify if to connect or to supply); consolidation requirement (replacing existing instruments with new ones); interfacing to legacy analyzers (specify if connectivity is known/certified); specific clinical protocols required (e.g. reflex testing, delta-check, ASAP routing).",
+        ),
+    ),
+)
+
+
 # ─── Main analysis function ───────────────────────────────────────
 
-def _single_analysis(
-    pages: List[str],
-    risk_factors: Dict[str, Any],
-    detail: str,
-    knowledge_context: str,
-    run_index: int = 0,
-) -> Dict[str, Any]:
-    """Execute one analysis pass and return the structured report dict."""
-    client = _get_client()
+# USD per 1M tokens: (input, output)
+MODEL_PRICING = {
+    "gpt-4o":      (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+}
 
-    MAX_TEXT = {"Low": 80_000, "Medium": 200_000, "High": 400_000}.get(detail, 200_000)
+# Default model per detail level — Low is a quick screen, the smaller model suffices
+DETAIL_MODELS = {"Low": "gpt-4o-mini", "Medium": "gpt-4o", "High": "gpt-4o"}
 
-    full_text = extract_raw_text(pages)
-    fallback_title, fallback_date = guess_title_and_date(pages)
 
+def _model_pricing(model: str) -> tuple[float, float]:
+    """Prices for a model name, also matching dated snapshots (e.g. gpt-4o-2024-08-06)."""
+    matches = [name for name in MODEL_PRICING if model.startswith(name)]
+    return MODEL_PRICING[max(matches, key=len)] if matches else MODEL_PRICING["gpt-4o"]
+
+
+# Characters of tender text sent to the model per detail level
+_MAX_TEXT = {"Low": 80_000, "Medium": 200_000, "High": 400_000}
+
+# Completion cap per detail level — bounds cost and latency of a runaway answer.
+# Medium and High stay at gpt-4o's 16k output ceiling, so no report that fitted
+# before the cap existed is cut off; Low asks for showstoppers only.
+_MAX_OUTPUT_TOKENS = {"Low": 6_000, "Medium": 16_000, "High": 16_000}
+
+# Seconds per request. A timeout is retried by the SDK (and billed again), so it
+# must sit well above a healthy run: 16k output tokens can take 5–7 minutes.
+_REQUEST_TIMEOUT_S = {"Low": _TIMEOUT_S, "Medium": _TIMEOUT_S, "High": 900.0}
+
+
+def _document_text(pages: List[str], detail: str) -> tuple[str, bool, int]:
+    """Return (tender text for the user prompt, whether it was truncated, chars analyzed)."""
+    MAX_TEXT = _MAX_TEXT.get(detail, 200_000)
+
+    # One char past the cap is enough to tell whether the document was truncated
+    full_text = extract_raw_text(pages, max_chars=MAX_TEXT + 1)
+    chars_analyzed = min(len(full_text), MAX_TEXT)
     truncated = len(full_text) > MAX_TEXT
     if truncated:
         full_text = (full_text[:MAX_TEXT]
                      + "\n\n[Document truncated — increase detail level for full analysis]")
+    return full_text, truncated, chars_analyzed
 
-    system_prompt = _build_system_prompt(risk_factors, knowledge_context)
-    user_prompt   = _build_user_prompt(full_text, detail)
 
-    # Slightly vary temperature across runs to encourage independent extraction
-    temperature = 0.1 + run_index * 0.1   # 0.1 → 0.2 → 0.3
+_TOKEN_LIMIT_PAT = _re.compile(r"Limit (\d+), Requested (\d+)")
 
-    for _attempt in range(4):
-        try:
-            response = client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user",   "content": user_prompt},
-                ],
-                temperature=temperature,
-                response_format={"type": "json_object"},
-            )
-            break
-        except RateLimitError as exc:
-            if "tokens" not in str(exc) or _attempt == 3:
-                raise
-            full_text = (full_text[: len(full_text) // 2]
-                         + "\n\n[Document truncated due to API token limits]")
-            user_prompt = _build_user_prompt(full_text, detail)
 
-    report = json.loads(response.choices[0].message.content)
+def _shrunk_length(error_message: str, text_len: int) -> int:
+    """New text length after a token-limit 429.
+
+    The error reports "Limit X, Requested Y", where Y also counts the system
+    prompt and the completion cap, which do not shrink. So the overshoot Y − X is
+    cut from the text (≈4 chars per token, plus 10% headroom) rather than scaling
+    the whole text by X/Y. Never keeps more than half, so it is at least as fast
+    as plain halving, which is also the fallback when the message cannot be parsed.
+    """
+    half = text_len // 2
+    m = _TOKEN_LIMIT_PAT.search(error_message)
+    if not m:
+        return half
+    limit, requested = int(m.group(1)), int(m.group(2))
+    if not 0 < limit < requested:
+        return half
+    overshoot_chars = int((requested - limit) * 4 * 1.1)
+    return max(0, min(text_len - overshoot_chars, half))
+
+
+def _chat_request(
+    model: str, system_prompt: str, user_prompt: str, temperature: float, detail: str,
+) -> Dict[str, Any]:
+    """Chat-completion parameters shared by the live and the Batch API paths."""
+    return {
+        "model": model,
+        "messages": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user",   "content": user_prompt},
+        ],
+        "temperature": temperature,
+        "max_tokens": _MAX_OUTPUT_TOKENS.get(detail, 12_000),
+        "response_format": {
+            "type": "json_schema",
+            "json_schema": {"name": "prebid_report", "strict": True, "schema": _REPORT_SCHEMA},
+        },
+    }
 
-    if not report.get("tender_title") or report["tender_title"] == "string":
+
+def _cached_tokens(usage: Any) -> int:
+    """Prompt tokens served from the prefix cache (0 when the API does not report it)."""
+    details = getattr(usage, "prompt_tokens_details", None)
+    return getattr(details, "cached_tokens", 0) or 0
+
+
+def _finalize_report(
+    report: Dict[str, Any],
+    pages: List[str],
+    detail: str,
+    model: str,
+    truncated: bool,
+    chars_analyzed: int,
+    prompt_tokens: int,
+    completion_tokens: int,
+    cached_tokens: int = 0,
+    price_factor: float = 1.0,
+) -> Dict[str, Any]:
+    """Patch missing metadata from the document heuristics and attach _meta."""
+    fallback_title, fallback_date = guess_title_and_date(pages)
+
+    if not report.get("tender_title"):
         report["tender_title"] = fallback_title
     if not report.get("tender_date"):
         report["tender_date"] = fallback_date
 
+    # Prompt tokens served from OpenAI's prefix cache are billed at half price
+    price_in, price_out = _model_pricing(model)
+    billed_prompt = prompt_tokens - cached_tokens / 2
     report["_meta"] = {
-        "model":             "gpt-4o",
-        "prompt_tokens":     response.usage.prompt_tokens,
-        "completion_tokens": response.usage.completion_tokens,
-        "total_tokens":      response.usage.total_tokens,
+        "model":             model,
+        "prompt_tokens":     prompt_tokens,
+        "cached_tokens":     cached_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens":      prompt_tokens + completion_tokens,
         "estimated_cost_usd": round(
-            (response.usage.prompt_tokens     * 2.50 / 1_000_000)
-            + (response.usage.completion_tokens * 10.00 / 1_000_000),
+            ((billed_prompt     * price_in  / 1_000_000)
+             + (completion_tokens * price_out / 1_000_000)) * price_factor,
             4,
         ),
         "detail_level":    detail,
         "pages_analyzed":  len(pages),
-        "chars_analyzed":  min(len(extract_raw_text(pages)), MAX_TEXT),
+        "chars_analyzed":  chars_analyzed,
         "truncated":       truncated,
     }
     return report
 
 
+class _UnusableResponse(RuntimeError):
+    """No choice of a completion was usable.
+
+    Carries the request's _meta, since it was billed all the same, and whether a
+    choice was cut off at the output-token limit (retrying would hit it again).
+    """
+
+    def __init__(self, message: str, meta: Dict[str, Any], cut_off: bool):
+        super().__init__(message)
+        self.meta = meta
+        self.cut_off = cut_off
+
+
+def _analysis_pass(
+    pages: List[str],
+    document: tuple[str, bool, int],
+    system_prompt: str,
+    detail: str,
+    model: str,
+    temperature: float,
+    n: int = 1,
+) -> Tuple[List[Dict[str, Any]], bool]:
+    """
+    One chat completion with n sampled reports (n > 1 bills the prompt once).
+    document is _document_text(pages, detail), built once by the caller.
+
+    Returns (usable reports, whether a choice was cut off at the output limit).
+    Refused or cut-off completions are dropped; if none is usable,
+    _UnusableResponse is raised. The request's token usage is attached to the
+    first report and the others carry zero, so summing _meta stays correct.
+    """
+    from openai import RateLimitError
+
+    client = _get_client()
+
+    full_text, truncated, chars_analyzed = document
+    user_prompt = _build_user_prompt(full_text, detail)
+    max_output = _MAX_OUTPUT_TOKENS.get(detail, 12_000)
+
+    # On token-limit 429s, resend a shorter prefix of the same text; slicing the
+    # original each time keeps a single truncation marker at the end.
+    text_len = len(full_text)
+    for _attempt in range(4):
+        # Rough estimate (≈4 chars per token) plus the completion cap, as OpenAI counts it
+        _rate_limiter.acquire((len(system_prompt) + len(user_prompt)) // 4 + max_output * n)
+        try:
+            request = _chat_request(model, system_prompt, user_prompt, temperature, detail)
+            if n > 1:
+                request["n"] = n
+            response = client.chat.completions.create(
+                **request, timeout=_REQUEST_TIMEOUT_S.get(detail, _TIMEOUT_S),
+            )
+            break
+        except RateLimitError as exc:
+            if "tokens" not in str(exc) or _attempt == 3:
+                raise
+            text_len = _shrunk_length(str(exc), text_len)
+            user_prompt = _build_user_prompt(
+                full_text[:text_len] + "\n\n[Document truncated due to API token limits]",
+                detail,
+            )
+
+    reports: List[Dict[str, Any]] = []
+    problem = ""
+    cut_off = False
+    for choice in response.choices:
+        message = choice.message
+        if getattr(message, "refusal", None):
+            problem = problem or f"Model refused the analysis: {message.refusal}"
+        elif choice.finish_reason == "length":
+            cut_off = True
+            problem = problem or (
+                f"The report exceeded the {max_output:,}-token output "
+                f"limit for detail level '{detail}' and was cut off."
+            )
+        else:
+            reports.append(json.loads(message.content))
+
+    usage = response.usage
+    billed = (usage.prompt_tokens, usage.completion_tokens, _cached_tokens(usage))
+    if not reports:
+        meta = _finalize_report(
+            {}, pages, detail, model, truncated, chars_analyzed, *billed,
+        )["_meta"]
+        raise _UnusableResponse(problem, meta, cut_off)
+
+    return [
+        _finalize_report(
+            report, pages, detail, model, truncated, chars_analyzed,
+            *(billed if i == 0 else (0, 0, 0)),
+        )
+        for i, report in enumerate(reports)
+    ], cut_off
+
+
+def _single_analysis(
+    pages: List[str],
+    document: tuple[str, bool, int],
+    system_prompt: str,
+    detail: str,
+    model: str,
+    run_index: int = 0,
+) -> Dict[str, Any]:
+    """Execute one analysis pass and return the structured report dict."""
+    # Slightly vary temperature across runs to encourage independent extraction
+    temperature = 0.1 + run_index * 0.1   # 0.1 → 0.2 → 0.3
+    return _analysis_pass(pages, document, system_prompt, detail, model, temperature)[0][0]
+
+
+def _consensus_runs(
+    pages: List[str],
+    document: tuple[str, bool, int],
+    system_prompt: str,
+    detail: str,
+    model: str,
+    n: int,
+) -> List[Dict[str, Any]]:
+    """
+    n independent reports for the consensus merge.
+
+    Sampled in one request with the API's n parameter, so the long prompt is sent
+    and billed once. Usable reports from that request are kept; missing runs are
+    made up with separate concurrent calls at staggered temperatures, unless a
+    report was cut off at the output limit, which further calls would hit too.
+    """
+    from openai import BadRequestError
+
+    spent: Dict[str, Any] = {}   # _meta of a request that yielded no report
+    try:
+        reports, cut_off = _analysis_pass(
+            pages, document, system_prompt, detail, model, temperature=0.2, n=n,
+        )
+    except _UnusableResponse as exc:
+        if exc.cut_off:
+            raise
+        reports, cut_off, spent = [], False, exc.meta
+    except BadRequestError:
+        reports, cut_off = [], False
+
+    if len(reports) < n and not cut_off:
+        with ThreadPoolExecutor(max_workers=n - len(reports)) as pool:
+            reports += pool.map(
+                lambda i: _single_analysis(
+                    pages, document, system_prompt, detail, model, run_index=i,
+                ),
+                range(len(reports), n),
+            )
+
+    if spent:
+        meta = reports[0]["_meta"]
+        for field in ("prompt_tokens", "cached_tokens", "completion_tokens", "total_tokens"):
+            meta[field] += spent[field]
+        meta["estimated_cost_usd"] = round(
+            meta["estimated_cost_usd"] + spent["estimated_cost_usd"], 4
+        )
+    return reports
+
+
+# Finished reports on disk, keyed by everything that determines the model input
+_REPORT_CACHE_DIR = os.path.join(_ASSETS_DIR, ".cache", "reports")
+# Bump when the analysis changes in ways the key cannot see (merge, sampling…)
+_REPORT_CACHE_VERSION = "2"
+
+
+def _report_cache_key(
+    full_text: str, n_pages: int, system_prompt: str, detail: str, model: str, runs: int,
+) -> str:
+    # full_text is the prepared document (preprocessing and length cap applied),
+    # so it stands in for the raw pages; the detail instructions, schema and
+    # output cap shape the response.
+    h = hashlib.sha256()
+    for part in (
+        _REPORT_CACHE_VERSION, system_prompt, full_text, str(n_pages),
+        detail, _DETAIL_INSTRUCTIONS.get(detail, ""), model, str(runs),
+        json.dumps(_REPORT_SCHEMA, sort_keys=True),
+        str(_MAX_OUTPUT_TOKENS.get(detail, 12_000)),
+    ):
+        h.update(part.encode("utf-8", "surrogatepass"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def _read_cached_report(key: str) -> Dict[str, Any] | None:
+    try:
+        with open(os.path.join(_REPORT_CACHE_DIR, f"{key}.json"), encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_cached_report(key: str, report: Dict[str, Any]) -> None:
+    path = os.path.join(_REPORT_CACHE_DIR, f"{key}.json")
+    try:
+        os.makedirs(_REPORT_CACHE_DIR, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, ensure_ascii=False)
+        os.replace(tmp, path)
+    except OSError:
+        pass   # the cache is an optimisation; a read-only checkout still works
+
+
 def build_prebid_report(
     pages: List[str],
     risk_factors: Dict[str, Any] | None = None,
     detail: str = "Medium",
     knowledge_context: str = "",
     runs: int = 1,
+    model: str | None = None,
+    use_cache: bool = True,
+    refresh_cache: bool = False,
 ) -> Dict[str, Any]:
     """
-    Main entry point. Analyzes a tender document using GPT-4o.
+    Main entry point. Analyzes a tender document with DETAIL_MODELS[detail]
+    (GPT-4o, or GPT-4o-mini for "Low") unless model is given.
 
     Args:
         pages:             Page texts extracted from the uploaded files.
@@ -713,23 +1157,227 @@ def build_prebid_report(
         detail:            "Low" | "Medium" | "High"
         knowledge_context: Pre-loaded knowledge base text. Auto-loaded from disk if empty.
         runs:              Number of independent analysis passes to run and merge (1–3).
-                           More runs = more stable output; each run adds ~1–4 min + cost.
+                           More runs = more stable output; runs are sampled in one
+                           request, so each adds output cost but little wall-clock time.
+        model:             OpenAI model. Defaults to gpt-4o-mini for "Low", gpt-4o otherwise.
+        use_cache:         Reuse the stored report when the same document is analysed
+                           with identical settings, risk register and knowledge base.
+        refresh_cache:     Run the analysis even if a stored report exists, and
+                           replace it with the new result.
 
     Returns:
         Structured report dict. If runs > 1, fields are merged via consensus strategy.
+        _meta["cache_hit"] is True when the report came from the cache; no API call
+        was made then, so estimated_cost_usd is 0 and the original run's cost is
+        kept in cached_cost_usd.
     """
     if risk_factors is None:
         risk_factors = load_risk_factors()
+    model = model or DETAIL_MODELS.get(detail, "gpt-4o")
 
     if not knowledge_context:
         try:
-            knowledge_context = _load_knowledge_context_from_disk()
+            knowledge_context = load_knowledge_context()
         except Exception:
             pass
 
+    # Serialised once per report and shared by all runs
+    system_prompt = _build_system_prompt(risk_factors, knowledge_context)
+
     n = max(1, min(runs, 3))
-    reports = [
-        _single_analysis(pages, risk_factors, detail, knowledge_context, run_index=i)
-        for i in range(n)
-    ]
-    return _merge_reports(reports) if n > 1 else reports[0]
+    # Stripped and capped once; shared by the cache key and every run
+    document = _document_text(pages, detail)
+    key = (_report_cache_key(document[0], len(pages), system_prompt, detail, model, n)
+           if use_cache else "")
+    if key and not refresh_cache:
+        cached = _read_cached_report(key)
+        if cached is not None:
+            meta = cached.setdefault("_meta", {})
+            meta["cache_hit"] = True
+            meta["cached_cost_usd"] = meta.get("estimated_cost_usd", 0)
+            meta["estimated_cost_usd"] = 0.0
+            return cached
+
+    if n == 1:
+        report = _single_analysis(pages, document, system_prompt, detail, model)
+    else:
+        reports = _consensus_runs(pages, document, system_prompt, detail, model, n)
+        report = _merge_reports(reports)
+        if len(reports) < n:
+            # Some runs were cut off at the output limit: record the shortfall and
+            # keep this weaker merge out of the cache for the full run count
+            report["_meta"]["runs_requested"] = n
+            key = ""
+    if key:
+        _write_cached_report(key, report)
+    report.setdefault("_meta", {})["cache_hit"] = False
+    return report
+
+
+def build_prebid_reports(
+    documents: List[List[str]],
+    risk_factors: Dict[str, Any] | None = None,
+    detail: str = "Medium",
+    knowledge_context: str = "",
+    runs: int = 1,
+    model: str | None = None,
+    use_cache: bool = True,
+    refresh_cache: bool = False,
+    max_workers: int = 4,
+) -> List[Dict[str, Any]]:
+    """
+    Analyse several tenders concurrently; returns reports in the order of documents.
+
+    Each document is a list of page texts, as for build_prebid_report(). The calls
+    are network-bound, so threads overlap the waits; max_workers bounds how many
+    requests are in flight against the account's rate limits.
+    """
+    if risk_factors is None:
+        risk_factors = load_risk_factors()
+    if not knowledge_context:
+        try:
+            knowledge_context = load_knowledge_context()
+        except Exception:
+            pass
+
+    def _run(pages: List[str]) -> Dict[str, Any]:
+        return build_prebid_report(
+            pages, risk_factors, detail, knowledge_context,
+            runs=runs, model=model, use_cache=use_cache, refresh_cache=refresh_cache,
+        )
+
+    _get_client()   # create the shared client before the threads race for it
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(documents) or 1))) as pool:
+        return list(pool.map(_run, documents))
+
+
+# ─── Batch API (bulk screening) ───────────────────────────────────
+#
+# For screening many tenders at once without waiting on each: the Batch API
+# bills tokens at 50% and completes within 24 h. submit_prebid_batch() queues
+# one request per document and consensus run; fetch_prebid_batch() returns the
+# reports (merged per document when runs > 1) once done.
+
+_BATCH_PENDING = ("validating", "in_progress", "finalizing")
+# "tender-<doc>-run-<k>"; batches queued before runs existed use "tender-<doc>"
+_BATCH_ID_PAT = _re.compile(r"tender-(\d+)(?:-run-(\d+))?")
+
+
+def submit_prebid_batch(
+    documents: List[List[str]],
+    risk_factors: Dict[str, Any] | None = None,
+    detail: str = "Medium",
+    knowledge_context: str = "",
+    model: str | None = None,
+    runs: int = 1,
+) -> str:
+    """
+    Queue one analysis per document (a list of page texts) on the OpenAI Batch API.
+    model defaults per detail level, as in build_prebid_report().
+    With runs > 1 (max 3), each document gets that many independent requests at
+    staggered temperatures, merged by fetch_prebid_batch().
+
+    Returns:
+        The batch id, to be passed to fetch_prebid_batch().
+    """
+    if risk_factors is None:
+        risk_factors = load_risk_factors()
+    model = model or DETAIL_MODELS.get(detail, "gpt-4o")
+
+    if not knowledge_context:
+        try:
+            knowledge_context = load_knowledge_context()
+        except Exception:
+            pass
+
+    system_prompt = _build_system_prompt(risk_factors, knowledge_context)
+    n = max(1, min(runs, 3))
+    lines = []
+    for i, pages in enumerate(documents):
+        full_text, _, _ = _document_text(pages, detail)
+        user_prompt = _build_user_prompt(full_text, detail)
+        for k in range(n):
+            lines.append(json.dumps({
+                "custom_id": f"tender-{i}-run-{k}",
+                "method":    "POST",
+                "url":       "/v1/chat/completions",
+                # Same temperature staggering as the per-run consensus calls
+                "body":      _chat_request(model, system_prompt, user_prompt,
+                                           0.1 + k * 0.1, detail),
+            }, ensure_ascii=False))
+
+    client = _get_client()
+    input_file = client.files.create(
+        file=("prebid_batch.jsonl", "\n".join(lines).encode("utf-8")),
+        purpose="batch",
+    )
+    batch = client.batches.create(
+        input_file_id=input_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h",
+    )
+    return batch.id
+
+
+def fetch_prebid_batch(
+    batch_id: str,
+    documents: List[List[str]],
+    detail: str = "Medium",
+) -> List[Dict[str, Any] | None] | None:
+    """
+    Collect the reports of a batch queued with submit_prebid_batch().
+
+    Args:
+        batch_id:  Id returned by submit_prebid_batch().
+        documents: The same documents, in the same order, as submitted
+                   (used for fallback title/date and _meta).
+        detail:    The detail level used at submission.
+
+    Returns:
+        None while the batch is still running; otherwise one report per
+        document, in submission order. Documents submitted with runs > 1 get
+        the consensus merge of their usable runs; None if every run failed.
+    """
+    client = _get_client()
+    batch = client.batches.retrieve(batch_id)
+    if batch.status in _BATCH_PENDING:
+        return None
+    if not batch.output_file_id:
+        raise RuntimeError(f"Batch {batch_id} ended with status '{batch.status}' and no output.")
+
+    by_doc: Dict[int, List[tuple]] = {}    # document index → [(run, report)]
+    doc_text: Dict[int, tuple] = {}
+    for line in client.files.content(batch.output_file_id).text.splitlines():
+        if not line.strip():
+            continue
+        item = json.loads(line)
+        response = item.get("response") or {}
+        if response.get("status_code") != 200:
+            continue
+        choice = response["body"]["choices"][0]
+        message = choice["message"]
+        if (choice.get("finish_reason") == "length"
+                or message.get("refusal") or not message.get("content")):
+            continue
+        m = _BATCH_ID_PAT.fullmatch(item["custom_id"])
+        if not m:
+            continue
+        i, k = int(m.group(1)), int(m.group(2) or 0)
+        body = response["body"]
+        pages = documents[i]
+        if i not in doc_text:
+            doc_text[i] = _document_text(pages, detail)
+        _, truncated, chars_analyzed = doc_text[i]
+        by_doc.setdefault(i, []).append((k, _finalize_report(
+            json.loads(message["content"]),
+            pages, detail, body.get("model", "gpt-4o"), truncated, chars_analyzed,
+            body["usage"]["prompt_tokens"], body["usage"]["completion_tokens"],
+            (body["usage"].get("prompt_tokens_details") or {}).get("cached_tokens", 0),
+            price_factor=0.5,
+        )))
+
+    reports: List[Dict[str, Any] | None] = [None] * len(documents)
+    for i, done in by_doc.items():
+        done.sort(key=lambda kr: kr[0])
+        reports[i] = done[0][1] if len(done) == 1 else _merge_reports([r for _, r in done])
+    return reports
@@ -2,7 +2,8 @@ from __future__ import annotations
 
 import io
 import datetime
-from typing import Dict, Any, Tuple
+from functools import lru_cache
+from typing import Dict, Any
 
 from docx import Document
 from docx.shared import Pt, RGBColor
@@ -13,9 +14,11 @@ from docx.oxml import OxmlElement
 from docx.oxml.ns import qn
 
 
-def _hex_to_rgb(hexstr: str) -> Tuple[int, int, int]:
+@lru_cache(maxsize=64)
+def _hex_to_rgb(hexstr: str) -> RGBColor:
+    # RGBColor is an immutable tuple, so one instance per colour can be shared
     hexstr = hexstr.lstrip("#")
-    return tuple(int(hexstr[i:i+2], 16) for i in (0, 2, 4))
+    return RGBColor(*(int(hexstr[i:i+2], 16) for i in (0, 2, 4)))
 
 
 def _set_cell_shading(cell, fill_hex: str):
@@ -32,47 +35,31 @@ def _set_cell_text(cell, text: str, bold: bool = False, color: str | None = None
     run.bold = bold
     run.font.size = Pt(size_pt)
     if color:
-        run.font.color.rgb = RGBColor(*_hex_to_rgb(color))
+        run.font.color.rgb = _hex_to_rgb(color)
 
 
 def _add_colored_heading(doc: Document, text: str, level: int, color_hex: str):
     p = doc.add_paragraph()
     style_name = f"CustomHeading{level}"
-    existing = [s.name for s in doc.styles]
-    if style_name not in existing:
+    try:
+        st = doc.styles[style_name]   # name lookup is a single XPath query
+    except KeyError:
         st = doc.styles.add_style(style_name, WD_STYLE_TYPE.PARAGRAPH)
         st.base_style = doc.styles[f"Heading {min(level, 9)}"]
-        st.font.color.rgb = RGBColor(*_hex_to_rgb(color_hex))
+        st.font.color.rgb = _hex_to_rgb(color_hex)
         st.font.bold = True
-    p.style = doc.styles[style_name]
+    p.style = st
     run = p.add_run(text)
-    run.font.color.rgb = RGBColor(*_hex_to_rgb(color_hex))
+    run.font.color.rgb = _hex_to_rgb(color_hex)
     run.bold = True
     return p
 
 
-def _set_run_font(run, name: str = "Montserrat", size_pt: int | None = None):
-    """Apply Montserrat (or fallback Calibri) to a run."""
-    run.font.name = name
-    if size_pt:
-        run.font.size = Pt(size_pt)
-    # Word theme-font override
-    from docx.oxml.ns import qn as _qn
-    from docx.oxml import OxmlElement as _el
-    rPr = run._r.get_or_add_rPr()
-    rFonts = rPr.find(_qn("w:rFonts"))
-    if rFonts is None:
-        rFonts = _el("w:rFonts")
-        rPr.insert(0, rFonts)
-    rFonts.set(_qn("w:ascii"),    name)
-    rFonts.set(_qn("w:hAnsi"),    name)
-    rFonts.set(_qn("w:cs"),       name)
-
-
 def build_docx(report: Dict[str, Any], primary_hex: str, accent_hex: str) -> bytes:
     doc = Document()
 
-    # Set default font to Montserrat for the whole document
+    # Set default font to Montserrat for the whole document; runs inherit it
+    # from Normal, so no per-run font overrides are needed
     from docx.oxml.ns import qn as _qn
     from docx.oxml import OxmlElement as _el
     style = doc.styles["Normal"]
@@ -81,6 +68,7 @@ def build_docx(report: Dict[str, Any], primary_hex: str, accent_hex: str) -> byt
     rFonts = _el("w:rFonts")
     rFonts.set(_qn("w:ascii"), "Montserrat")
     rFonts.set(_qn("w:hAnsi"), "Montserrat")
+    rFonts.set(_qn("w:cs"), "Montserrat")
     rPr.insert(0, rFonts)
 
     # Cover block
@@ -88,18 +76,15 @@ def build_docx(report: Dict[str, Any], primary_hex: str, accent_hex: str) -> byt
     r = title.add_run("INPECO  ·  Tender Intake Report")
     r.bold = True
     r.font.size = Pt(22)
-    r.font.color.rgb = RGBColor(*_hex_to_rgb(primary_hex))
-    _set_run_font(r, size_pt=22)
+    r.font.color.rgb = _hex_to_rgb(primary_hex)
     title.alignment = WD_ALIGN_PARAGRAPH.LEFT
 
     subtitle = doc.add_paragraph()
     r2 = subtitle.add_run(f"{report.get('tender_title', '')} — {report.get('tender_date', '')}")
     r2.italic = True
     r2.font.size = Pt(11)
-    _set_run_font(r2, size_pt=11)
 
-    gen_p = doc.add_paragraph(f"Generated: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M')}")
-    _set_run_font(gen_p.runs[0] if gen_p.runs else gen_p.add_run(""))
+    doc.add_paragraph(f"Generated: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M')}")
 
     # 1 Executive summary
     _add_colored_heading(doc, "1. Executive Summary", 1, primary_hex)
@@ -227,7 +212,7 @@ def build_docx(report: Dict[str, Any], primary_hex: str, accent_hex: str) -> byt
     rec_run = rec_p.add_run(f"Recommendation: {gn.get('recommendation','')}")
     rec_run.bold = True
     rec_run.font.size = Pt(14)
-    rec_run.font.color.rgb = RGBColor(*_hex_to_rgb(accent_hex if gn.get("recommendation") != "GO" else primary_hex))
+    rec_run.font.color.rgb = _hex_to_rgb(accent_hex if gn.get("recommendation") != "GO" else primary_hex)
 
     if gn.get("rationale"):
         doc.add_paragraph(str(gn["rationale"]))